@@ -1,53 +1,64 @@
 # analysis_examples.py
 
 import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Optional
+
 from db_utils import get_connection
+from asof_join import iter_asof_join
+
+def temp_bucket(temperature_c: Optional[float]) -> str:
+    """Kategoryzacja temperatury (Bucketing) dla celów analitycznych."""
+    if temperature_c is None:
+        return 'brak danych'
+    if temperature_c < 0:
+        return '< 0°C'
+    if temperature_c <= 10:
+        return '0–10°C'
+    if temperature_c <= 20:
+        return '10–20°C'
+    return '> 20°C'
 
 def avg_jam_factor_by_temp_bucket() -> None:
     """
     Analizuje zależność między temperaturą a natężeniem ruchu (Jam Factor).
-    
-    Wykonuje agregację danych z tabel 'traffic' i 'weather', grupując wyniki
-    w przedziały temperaturowe (kubełki) w celu znalezienia korelacji.
+
+    Każda próbka ruchu łączona jest z najbliższą w czasie obserwacją pogodową
+    (złączenie as-of w oknie tolerancji), a wyniki grupowane są w przedziały
+    temperaturowe (kubełki) w celu znalezienia korelacji. Agregacja odbywa się
+    strumieniowo, bez wczytywania tabel do pamięci.
     """
     conn = get_connection()
-    cur = conn.cursor()
-
-    query = """
-        SELECT
-            -- Kategoryzacja temperatury (Bucketing) dla celów analitycznych
-            CASE
-                WHEN w.temperature_c IS NULL THEN 'brak danych'
-                WHEN w.temperature_c < 0 THEN '< 0°C'
-                WHEN w.temperature_c BETWEEN 0 AND 10 THEN '0–10°C'
-                WHEN w.temperature_c BETWEEN 10 AND 20 THEN '10–20°C'
-                ELSE '> 20°C'
-            END AS temp_bucket,
-            AVG(t.jam_factor) AS avg_jam,
-            COUNT(t.id) as count_records
-        FROM traffic t
-        LEFT JOIN weather w
-          -- Łączenie rekordów po wspólnej godzinie (format ISO: YYYY-MM-DDTHH)
-          ON substr(t.timestamp, 1, 13) = substr(w.timestamp, 1, 13)
-        WHERE w.temperature_c IS NOT NULL
-        GROUP BY temp_bucket
-        ORDER BY avg_jam DESC;
-    """
+
+    sums: Dict[str, float] = defaultdict(float)
+    counts: Dict[str, int] = defaultdict(int)
 
     try:
-        cur.execute(query)
-        rows = cur.fetchall()
-        
+        joined = iter_asof_join(conn, traffic_cols=("jam_factor",), weather_cols=("temperature_c",))
+        for t_row, w_row, _lag in joined:
+            # Pomijamy próbki bez pogody w oknie tolerancji oraz bez wartości korka
+            if w_row is None or w_row[2] is None or t_row[2] is None:
+                continue
+            bucket = temp_bucket(w_row[2])
+            sums[bucket] += t_row[2]
+            counts[bucket] += 1
+
+        rows: List = sorted(
+            ((bucket, sums[bucket] / counts[bucket], counts[bucket]) for bucket in counts),
+            key=lambda r: r[1],
+            reverse=True,
+        )
+
         # Wyświetlanie wyników w formie tabelarycznej
         print(f"{'Kategoria Temp':<15} | {'Średni Korek':<20} | {'Liczba próbek'}")
         print("-" * 55)
-        for temp_bucket, avg_jam, count in rows:
-            print(f"{temp_bucket:<15} | {avg_jam:<20.4f} | {count}")
-            
-    except sqlite3.Error as e:
+        for bucket, avg_jam, count in rows:
+            print(f"{bucket:<15} | {avg_jam:<20.4f} | {count}")
+
+    except (sqlite3.Error, ValueError) as e:
         print(f"Błąd wykonywania zapytania analitycznego: {e}")
     finally:
         conn.close()
 
 if __name__ == "__main__":
-    avg_jam_factor_by_temp_bucket()
\ No newline at end of file
+    avg_jam_factor_by_temp_bucket()
@@ -0,0 +1,285 @@
+# asof_join.py
+
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from db_utils import get_connection
+from config import ASOF_TOLERANCE_MINUTES, ASOF_DIRECTION
+
+"""
+Złączenie typu "as-of" szeregów czasowych ruchu i pogody.
+
+Każda próbka ruchu otrzymuje ostatnią wcześniejszą (lub najbliższą) obserwację
+pogodową w zadanym oknie tolerancji. Obie tabele czytane są strumieniowo
+w kolejności czasu (indeksy idx_traffic_time / idx_weather_time), a dopasowanie
+odbywa się w jednym przebiegu scalania O(n + m) ze stałym zużyciem pamięci.
+"""
+
+DIRECTIONS = ("backward", "nearest")
+
+# Rozmiar paczki przy zapisie zmaterializowanego złączenia
+MATERIALIZE_BATCH_SIZE = 5000
+
+Row = Tuple[Any, ...]
+JoinedRow = Tuple[Row, Optional[Row], Optional[float]]
+
+
+def parse_timestamp(value: str) -> float:
+    """
+    Zamienia znacznik czasu ISO 8601 na sekundy epoki (UTC).
+
+    Obsługuje oba formaty występujące w bazie: '...+00:00' (traffic)
+    oraz '...Z' (weather). Znaczniki bez strefy traktowane są jako UTC.
+    """
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _try_parse_timestamp(value: Any) -> Optional[float]:
+    """Jak parse_timestamp, ale dla wartości niepoprawnej (lub nie-tekstowej) zwraca None."""
+    try:
+        return parse_timestamp(value)
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class _AsofCursor:
+    """
+    Wskaźnik scalania po jednym posortowanym strumieniu obserwacji 'right'.
+
+    Przechowuje tylko dwa wiersze: ostatni nie późniejszy niż bieżąca próbka
+    oraz pierwszy późniejszy (lookahead). Wiersze z niepoprawnym znacznikiem
+    czasu są pomijane i zliczane w polu 'skipped'.
+    """
+
+    def __init__(self, right: Iterable[Row], tolerance_s: float, direction: str) -> None:
+        self._iter = iter(right)
+        self.tolerance_s = tolerance_s
+        self.direction = direction
+        self.skipped = 0
+        self.prev: Optional[Row] = None
+        self.prev_t = 0.0
+        self.nxt: Optional[Row] = None
+        self.nxt_t = 0.0
+        self._advance()
+
+    def _advance(self) -> None:
+        """Wczytuje kolejny poprawny wiersz do lookahead (None na końcu strumienia)."""
+        for row in self._iter:
+            t = _try_parse_timestamp(row[1])
+            if t is None:
+                self.skipped += 1
+                continue
+            self.nxt, self.nxt_t = row, t
+            return
+        self.nxt = None
+
+    def match(self, t: float) -> Tuple[Optional[Row], Optional[float]]:
+        """Zwraca (obserwacja, lag_s) dla próbki z chwili t lub (None, None)."""
+        # Przesunięcie wskaźnika do ostatniej obserwacji <= t
+        while self.nxt is not None and self.nxt_t <= t:
+            self.prev, self.prev_t = self.nxt, self.nxt_t
+            self._advance()
+
+        match: Optional[Row] = None
+        lag: Optional[float] = None
+
+        if self.prev is not None and t - self.prev_t <= self.tolerance_s:
+            match, lag = self.prev, t - self.prev_t
+
+        if self.direction == "nearest" and self.nxt is not None:
+            ahead = self.nxt_t - t
+            if ahead <= self.tolerance_s and (lag is None or ahead < lag):
+                match, lag = self.nxt, -ahead
+
+        return match, lag
+
+
+def _log_skipped(left_skipped: int, right_skipped: int) -> None:
+    """Raportuje (raz, po zakończeniu scalania) wiersze z niepoprawnym znacznikiem czasu."""
+    if left_skipped or right_skipped:
+        logging.warning(
+            "Złączenie as-of: niepoprawny timestamp w %d próbkach ruchu i %d obserwacjach pogody.",
+            left_skipped, right_skipped,
+        )
+
+
+def asof_merge(left: Iterable[Row], right: Iterable[Row], tolerance_s: float,
+               direction: str = "backward") -> Iterator[JoinedRow]:
+    """
+    Scala dwa posortowane po czasie strumienie wierszy (timestamp pod indeksem 1).
+
+    Dla każdego wiersza 'left' zwraca krotkę (left_row, right_row, lag_s), gdzie
+    lag_s to różnica czasu left - right w sekundach (ujemna, gdy obserwacja
+    jest późniejsza niż próbka). Wiersze bez dopasowania w oknie tolerancji
+    zwracane są z right_row = None (semantyka LEFT JOIN).
+
+    Wiersze z niepoprawnym znacznikiem czasu nie przerywają scalania: próbki
+    'left' zwracane są bez dopasowania, obserwacje 'right' są pomijane.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Nieobsługiwany kierunek złączenia: {direction}")
+
+    cursor = _AsofCursor(right, tolerance_s, direction)
+    left_skipped = 0
+
+    for row in left:
+        t = _try_parse_timestamp(row[1])
+        if t is None:
+            left_skipped += 1
+            yield row, None, None
+            continue
+        match, lag = cursor.match(t)
+        yield row, match, lag
+
+    _log_skipped(left_skipped, cursor.skipped)
+
+
+def _column_list(alias: str, columns: Sequence[str]) -> str:
+    """Buduje listę kolumn SELECT: zawsze id i timestamp, następnie kolumny dodatkowe."""
+    return ", ".join(f"{alias}.{c}" for c in ("id", "timestamp", *columns))
+
+
+def _asof_merge_by_site(conn: sqlite3.Connection, t_cols: str, w_cols: str,
+                        tolerance_s: float, direction: str) -> Iterator[JoinedRow]:
+    """
+    Złączenie as-of z podziałem na stacje: jeden przebieg po 'traffic'.
+
+    Tabela 'traffic' czytana jest raz, w kolejności czasu, razem ze stacją
+    przypisaną do punktu (klucze całkowite point_id -> site_id). Każda stacja
+    ma własny strumień obserwacji (indeks idx_weather_site_time), otwierany
+    przy pierwszej próbce tej stacji. Koszt: O(n + m) oraz jeden otwarty
+    kursor SQLite na stację w pamięci.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"Nieobsługiwany kierunek złączenia: {direction}")
+
+    sites = {
+        site_id: (lat, lon)
+        for site_id, lat, lon in conn.execute("SELECT id, lat, lon FROM weather_sites")
+    }
+    cursors: Dict[int, _AsofCursor] = {}
+    left_skipped = 0
+
+    traffic_cur = conn.cursor()
+    traffic_cur.execute(f"""
+        SELECT {t_cols}, m.site_id
+        FROM traffic t
+        LEFT JOIN point_site_map m ON m.point_id = t.point_id
+        ORDER BY t.timestamp
+    """)
+    for *values, site_id in traffic_cur:
+        row = tuple(values)
+        t = _try_parse_timestamp(row[1])
+        if t is None:
+            left_skipped += 1
+            yield row, None, None
+            continue
+        if site_id is None or site_id not in sites:
+            # Punkt bez stacji w zasięgu: brak dopasowania
+            yield row, None, None
+            continue
+
+        cursor = cursors.get(site_id)
+        if cursor is None:
+            weather_cur = conn.cursor()
+            weather_cur.execute(f"""
+                SELECT {w_cols}
+                FROM weather w
+                WHERE w.lat = ? AND w.lon = ?
+                ORDER BY w.timestamp
+            """, sites[site_id])
+            cursor = cursors[site_id] = _AsofCursor(weather_cur, tolerance_s, direction)
+
+        match, lag = cursor.match(t)
+        yield row, match, lag
+
+    _log_skipped(left_skipped, sum(c.skipped for c in cursors.values()))
+
+
+def iter_asof_join(conn: sqlite3.Connection,
+                   traffic_cols: Sequence[str] = (),
+                   weather_cols: Sequence[str] = (),
+                   tolerance_minutes: float = ASOF_TOLERANCE_MINUTES,
+                   direction: str = ASOF_DIRECTION,
+                   by_site: bool = False) -> Iterator[JoinedRow]:
+    """
+    Strumieniowe złączenie as-of tabel 'traffic' i 'weather'.
+
+    Wiersze mają postać (id, timestamp, *kolumny_dodatkowe). Przy by_site=True
+    każdy punkt ruchu łączony jest wyłącznie z obserwacjami przypisanej mu
+    stacji pogodowej (tabela 'point_site_map' z modułu spatial_index);
+    tabela 'traffic' jest wtedy nadal czytana jednokrotnie.
+    """
+    tolerance_s = tolerance_minutes * 60.0
+    t_cols = _column_list("t", traffic_cols)
+    w_cols = _column_list("w", weather_cols)
+
+    if by_site:
+        yield from _asof_merge_by_site(conn, t_cols, w_cols, tolerance_s, direction)
+        return
+
+    traffic_cur = conn.cursor()
+    weather_cur = conn.cursor()
+    traffic_cur.execute(f"SELECT {t_cols} FROM traffic t ORDER BY t.timestamp")
+    weather_cur.execute(f"SELECT {w_cols} FROM weather w ORDER BY w.timestamp")
+    yield from asof_merge(traffic_cur, weather_cur, tolerance_s, direction)
+
+
+def materialize_asof_join(tolerance_minutes: float = ASOF_TOLERANCE_MINUTES,
+                          direction: str = ASOF_DIRECTION,
+                          by_site: bool = False) -> int:
+    """
+    Zapisuje wynik złączenia as-of do tabeli 'traffic_weather'.
+
+    Tabela przechowuje wyłącznie klucze (traffic_id, weather_id) oraz
+    przesunięcie czasowe, więc dalsze analizy łączą dane po kluczach
+    całkowitych. Tabela jest przebudowywana w całości. Zwraca liczbę
+    zapisanych par (również tych bez dopasowania, z weather_id = NULL).
+    """
+    conn = get_connection()
+    written = 0
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS traffic_weather (
+                traffic_id INTEGER PRIMARY KEY,
+                weather_id INTEGER,
+                lag_seconds REAL
+            );
+        """)
+        cur.execute("DELETE FROM traffic_weather")
+
+        insert = "INSERT INTO traffic_weather (traffic_id, weather_id, lag_seconds) VALUES (?, ?, ?)"
+        batch = []
+        for t_row, w_row, lag in iter_asof_join(conn, tolerance_minutes=tolerance_minutes,
+                                                direction=direction, by_site=by_site):
+            batch.append((t_row[0], w_row[0] if w_row else None, lag))
+            if len(batch) >= MATERIALIZE_BATCH_SIZE:
+                cur.executemany(insert, batch)
+                written += len(batch)
+                batch.clear()
+        if batch:
+            cur.executemany(insert, batch)
+            written += len(batch)
+
+        conn.commit()
+    except sqlite3.Error as e:
+        logging.error("Błąd materializacji złączenia as-of: %s", e)
+        conn.rollback()
+        written = 0
+    finally:
+        conn.close()
+
+    return written
+
+
+if __name__ == "__main__":
+    count = materialize_asof_join()
+    print(f"✅ Zmaterializowano złączenie as-of (traffic_weather): {count} wierszy")
@@ -4,10 +4,8 @@ import shutil
 import logging
 import os
 from datetime import datetime
-from pathlib import Path
-from config import DB_PATH
+from config import DB_PATH, BACKUP_DIR
 
-BACKUP_DIR = Path("backups")
 BACKUP_RETENTION_LIMIT = 5  # Liczba przechowywanych ostatnich kopii
 
 def perform_backup() -> None:
@@ -23,7 +21,7 @@ def perform_backup() -> None:
             logging.warning("Backup anulowany: Brak pliku bazy danych.")
             return
 
-        BACKUP_DIR.mkdir(exist_ok=True)
+        BACKUP_DIR.mkdir(parents=True, exist_ok=True)
         
         # Generowanie nazwy pliku: traffic_backup_YYYY-MM-DD_HH-MM.db
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
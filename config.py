@@ -13,10 +13,13 @@ Centralne miejsce zarządzania stałymi, ścieżkami oraz zmiennymi środowiskow
 load_dotenv()
 
 # --- KONFIGURACJA BAZY DANYCH ---
-DB_DIR = Path("db")
+DB_DIR = Path(os.getenv("DB_DIR", "db"))
 DB_NAME = "traffic.db"
 DB_PATH = DB_DIR / DB_NAME
 
+# Katalog kopii zapasowych bazy (backup_utils.perform_backup)
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", "backups"))
+
 # --- KONFIGURACJA LOKALIZACJI ---
 CITY_NAME = "opole"
 COUNTRY_SLUG = "poland"
@@ -32,8 +35,38 @@ TRAFFIC_POINTS = {
 ACTIVE_POINT_KEY = "ozimska_reymonta"
 LAT_OP, LON_OP = TRAFFIC_POINTS[ACTIVE_POINT_KEY]
 
+# Lokalizacje źródeł danych pogodowych (szerokość, długość geograficzna).
+# Scraper zapisuje obserwacje pod współrzędnymi aktywnego punktu.
+WEATHER_SITES = {
+    "opole_timeanddate": (LAT_OP, LON_OP),
+}
+
+# Stacja, dla której weather_scraper zapisuje obserwacje
+WEATHER_SITE_KEY = "opole_timeanddate"
+
+# Miasto scrapowane dla stacji (klucz rejestru pokrycia: "kraj/miasto")
+WEATHER_SITE_CITIES = {
+    WEATHER_SITE_KEY: f"{COUNTRY_SLUG}/{CITY_NAME}",
+}
+
+# Maksymalna odległość przypisania punktu ruchu do stacji pogodowej (km)
+SITE_MATCH_MAX_KM = 50.0
+
+# --- KONFIGURACJA ZŁĄCZENIA AS-OF (RUCH <-> POGODA) ---
+# Maksymalny odstęp między próbką ruchu a obserwacją pogodową (minuty)
+ASOF_TOLERANCE_MINUTES = 90
+# "backward" - ostatnia wcześniejsza obserwacja, "nearest" - najbliższa w czasie
+ASOF_DIRECTION = "nearest"
+
 # --- KONFIGURACJA API (TOMTOM) ---
-TOMTOM_API_URL = "https://api.tomtom.com/traffic/services/4/flowSegmentData/absolute/10/json"
+# Adres endpointu można nadpisać (np. lokalnym stubem w testach obciążeniowych)
+TOMTOM_API_URL = os.getenv(
+    "TOMTOM_API_URL",
+    "https://api.tomtom.com/traffic/services/4/flowSegmentData/absolute/10/json",
+)
+
+# Liczba równoległych zapytań przy pobieraniu wielu punktów w jednym cyklu
+TRAFFIC_FETCH_WORKERS = int(os.getenv("TRAFFIC_FETCH_WORKERS", "8"))
 
 # Pobranie klucza z bezpiecznego magazynu (.env)
 TOMTOM_API_KEY = os.getenv("TOMTOM_API_KEY")
@@ -47,5 +80,35 @@ if not TOMTOM_API_KEY:
 
 # --- KONFIGURACJA SCRAPINGU POGODY ---
 HISTORY_YEAR = 2024
-WEATHER_BASE_URL = "https://www.timeanddate.com/weather"
-WEATHER_HISTORY_URL = f"{WEATHER_BASE_URL}/{COUNTRY_SLUG}/{CITY_NAME}/historic"
\ No newline at end of file
+WEATHER_BASE_URL = os.getenv("WEATHER_BASE_URL", "https://www.timeanddate.com/weather")
+
+# Lista proxy do rotacji IP (oddzielona przecinkami); pusta wartość wyłącza proxy
+WEATHER_PROXIES = [
+    p.strip()
+    for p in os.getenv("WEATHER_PROXIES", "http://20.210.113.32:8123,http://186.121.235.66:8080").split(",")
+    if p.strip()
+]
+WEATHER_HISTORY_URL = f"{WEATHER_BASE_URL}/{COUNTRY_SLUG}/{CITY_NAME}/historic"
+
+# Minimalna liczba obserwacji, od której dzień uznawany jest za kompletny
+WEATHER_MIN_ROWS_PER_DAY = 20
+# Polityka ponawiania nieudanych dni (exponential backoff)
+WEATHER_RETRY_BASE_MINUTES = 30
+WEATHER_RETRY_MAX_MINUTES = 24 * 60
+WEATHER_MAX_ATTEMPTS = 8
+
+# --- KONFIGURACJA LOGOWANIA ---
+LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
+LOG_FILE_NAME = "app.log"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+
+# Format linii logu: "text" (czytelny dla człowieka) lub "json" (JSON Lines dla agregatorów)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
+# Strategia rotacji pliku logu: "size" (po przekroczeniu rozmiaru) lub "time" (o północy)
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # 10 MB
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+
+# Próbkowanie logów z gorącej ścieżki: przepuszczany jest co N-ty komunikat danego typu
+LOG_SAMPLE_EVERY_N = int(os.getenv("LOG_SAMPLE_EVERY_N", "10"))
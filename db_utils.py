@@ -36,7 +36,8 @@ def init_db() -> None:
             speed_limit REAL,
             jam_factor REAL,           -- Obliczony współczynnik korka (0-10)
             confidence REAL,
-            provider TEXT
+            provider TEXT,
+            point_id INTEGER           -- Klucz punktu pomiarowego (traffic_points.id)
         );
     """)
 
@@ -63,9 +64,26 @@ def init_db() -> None:
     cur.execute("CREATE INDEX IF NOT EXISTS idx_traffic_time ON traffic(timestamp);")
     cur.execute("CREATE INDEX IF NOT EXISTS idx_weather_time ON weather(timestamp);")
 
+    # Unikalność obserwacji pogodowej (deduplikacja przez INSERT OR IGNORE)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_unique ON weather(timestamp, lat, lon);")
+
+    # Migracja baz sprzed wprowadzenia klucza punktu pomiarowego
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(traffic)")]
+    migrated = "point_id" not in columns
+    if migrated:
+        cur.execute("ALTER TABLE traffic ADD COLUMN point_id INTEGER;")
+
     conn.commit()
     conn.close()
 
+    # Indeks przestrzenny (import lokalny: spatial_index sam korzysta z db_utils)
+    from spatial_index import init_spatial_index, sync_sites, backfill_point_ids
+    init_spatial_index()
+    # Stacje z konfiguracji muszą istnieć, zanim zapis ruchu zacznie rejestrować punkty
+    sync_sites()
+    if migrated:
+        backfill_point_ids()
+
 
 if __name__ == "__main__":
     init_db()
@@ -3,56 +3,105 @@
 import time
 import random
 import logging
-from datetime import date, timedelta
+import argparse
+from datetime import date
+from typing import Dict, List
 
 from db_utils import init_db
 from config import HISTORY_YEAR
 from weather_scraper import scrape_day
+from weather_coverage import init_coverage, sync_row_counts, find_gaps, coverage_summary, STATUS_ERROR
 from logger_config import setup_logging
 
 def is_leap_year(year: int) -> bool:
     """Sprawdza, czy rok jest przestępny."""
     return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
 
+def _scrape_days(days: List[date]) -> Dict[str, int]:
+    """
+    Pobiera kolejno wskazane dni z zachowaniem Politeness Policy.
+
+    Zwraca liczbę dni w podziale na status pobrania.
+    """
+    stats: Dict[str, int] = {}
+
+    for i, current_date in enumerate(days):
+        # Postęp trafia do kolejki logów (bez blokującego print), z próbkowaniem
+        logging.info("--- Przetwarzanie dnia %d/%d: %s ---", i + 1, len(days), current_date,
+                     extra={"sampled": True})
+
+        try:
+            status = scrape_day(current_date)
+        except Exception as e:
+            # Logujemy błąd, ale nie przerywamy pętli (kontynuujemy następny dzień)
+            logging.error("Nieudane pobieranie dla daty %s: %s", current_date, e)
+            status = STATUS_ERROR
+        stats[status] = stats.get(status, 0) + 1
+
+        # --- Rate Limiting / Politeness Policy ---
+        # Losowe opóźnienie (1-3s) symulujące zachowanie człowieka
+        sleep_time = random.uniform(1, 3)
+        time.sleep(sleep_time)
+
+    return stats
+
+def _prepare(year: int) -> None:
+    """Tworzy tabele (dane + rejestr pokrycia) i uzupełnia rejestr o istniejące rekordy."""
+    init_db()
+    init_coverage()
+    sync_row_counts(year)
+
 def scrape_year(year: int) -> None:
     """
     Pobiera dane historyczne dzień po dniu dla całego podanego roku.
     
+    Dni już kompletne (wg rejestru pokrycia) są pomijane, więc ponowne
+    uruchomienie nie pobiera całego roku od nowa.
     Proces uwzględnia losowe opóźnienia (Rate Limiting), aby uniknąć
     blokady ze strony serwera docelowego (Politeness Policy).
     """
-    # Upewniamy się, że tabela istnieje przed startem
-    init_db()
+    # Upewniamy się, że tabele istnieją przed startem
+    _prepare(year)
 
-    start_date = date(year, 1, 1)
     days_in_year = 366 if is_leap_year(year) else 365
+    days = find_gaps(year, respect_backoff=False, include_exhausted=True)
     
-    logging.info(f"Rozpoczynanie scrapingu historycznego dla roku {year}. Liczba dni: {days_in_year}")
+    logging.info("Rozpoczynanie scrapingu historycznego dla roku %d. Dni do pobrania: %d/%d",
+                 year, len(days), days_in_year)
 
-    for i in range(days_in_year):
-        current_date = start_date + timedelta(days=i)
-        
-        # Zabezpieczenie przed wyjściem poza rok (np. przy błędnej kalkulacji)
-        if current_date.year != year:
-            break
+    stats = _scrape_days(days)
 
-        progress_msg = f"Przetwarzanie dnia {i + 1}/{days_in_year}: {current_date}"
-        print(f"--- {progress_msg} ---")  # Print dla natychmiastowego podglądu w konsoli
+    logging.info("Zakończono pobieranie danych historycznych dla roku %d. Statusy: %s", year, stats)
 
-        try:
-            scrape_day(current_date)
-        except Exception as e:
-            # Logujemy błąd, ale nie przerywamy pętli (kontynuujemy następny dzień)
-            logging.error(f"Nieudane pobieranie dla daty {current_date}: {e}")
+def rescrape_gaps(year: int, force: bool = False) -> None:
+    """
+    Ponownie pobiera wyłącznie brakujące lub niekompletne dni roku.
 
-        # --- Rate Limiting / Politeness Policy ---
-        # Losowe opóźnienie (1-3s) symulujące zachowanie człowieka
-        sleep_time = random.uniform(1, 3)
-        time.sleep(sleep_time)
+    Respektuje politykę backoff z rejestru pokrycia (dni z odroczoną próbą
+    i dni, które wyczerpały limit prób, są pomijane). Przy force=True
+    pobierane są wszystkie luki niezależnie od backoffu.
+    """
+    _prepare(year)
 
-    logging.info(f"Zakończono pobieranie danych historycznych dla roku {year}.")
+    days = find_gaps(year, respect_backoff=not force, include_exhausted=force)
+    logging.info("Wykryto %d luk do uzupełnienia w roku %d.", len(days), year)
+
+    stats = _scrape_days(days)
+
+    for status, day_count, row_count in coverage_summary(year):
+        logging.info("Pokrycie %d [%s]: dni=%d, rekordy=%d", year, status, day_count, row_count or 0)
+    logging.info("Zakończono uzupełnianie luk dla roku %d. Statusy: %s", year, stats)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scraping historycznych danych pogodowych.")
+    parser.add_argument("--year", type=int, default=HISTORY_YEAR, help="Rok do pobrania")
+    parser.add_argument("--gaps", action="store_true", help="Pobierz tylko brakujące/niekompletne dni")
+    parser.add_argument("--force", action="store_true", help="Ignoruj backoff i limit prób (z --gaps)")
+    args = parser.parse_args()
+
     # Konfiguracja loggera przed uruchomieniem procesu
     setup_logging()
-    scrape_year(HISTORY_YEAR)
\ No newline at end of file
+    if args.gaps:
+        rescrape_gaps(args.year, force=args.force)
+    else:
+        scrape_year(args.year)
@@ -1,25 +1,192 @@
 # logger_config.py
 
+import atexit
+import copy
+import gzip
+import json
 import logging
-from pathlib import Path
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from config import (
+    LOG_DIR, LOG_FILE_NAME, LOG_LEVEL, LOG_FORMAT, LOG_ROTATION,
+    LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE_EVERY_N,
+)
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"  # Czysty format daty bez milisekund
+
+# Aktywny wątek nasłuchujący kolejki (jeden na proces)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formatuje rekord logu jako pojedynczą linię JSON (JSON Lines).
+
+    Format ułatwia import logów do narzędzi analitycznych (np. ELK, Loki)
+    bez konieczności parsowania tekstu wyrażeniami regularnymi.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "thread": record.threadName,
+        }
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, który nie wkleja tracebacku do treści komunikatu.
+
+    Standardowy QueueHandler.prepare() formatuje cały rekord (razem z wyjątkiem)
+    do pola 'msg'. Tutaj treść i traceback trafiają do kolejki osobno
+    ('msg' i 'exc_text'), więc formatter JSON może je rozdzielić, a formatter
+    tekstowy i tak dołącza 'exc_text' na końcu linii.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            # Formatowanie w wątku wywołującym: obiekty ramek nie trafiają do kolejki
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Przepuszcza co N-ty komunikat oznaczony jako próbkowany (extra={"sampled": True}).
+
+    Dotyczy wyłącznie komunikatów z gorącej ścieżki (np. "Ruch w normie" dla
+    każdego punktu w każdym cyklu). Rekordy WARNING i wyższe oraz rekordy
+    bez oznaczenia przechodzą zawsze. Liczniki prowadzone są osobno dla każdego
+    szablonu komunikatu, więc rzadkie komunikaty nie są wypierane przez częste.
+    """
+
+    def __init__(self, every_n: int) -> None:
+        super().__init__()
+        self.every_n = max(1, every_n)
+        self._counters: Dict[Tuple[str, int], int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+
+        key = (str(record.msg), record.levelno)
+        with self._lock:
+            count = self._counters[key]
+            self._counters[key] = count + 1
+        return count % self.every_n == 0
+
+
+def _gzip_namer(name: str) -> str:
+    """Nadaje zrotowanym plikom rozszerzenie .gz."""
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    """Kompresuje zrotowany plik logu (gzip) i usuwa oryginał."""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _build_file_handler() -> logging.Handler:
+    """
+    Tworzy handler pliku z rotacją i kompresją starszych plików.
+
+    Strategia "size" rotuje po przekroczeniu LOG_MAX_BYTES, strategia "time"
+    rotuje codziennie o północy. W obu przypadkach przechowywanych jest
+    LOG_BACKUP_COUNT skompresowanych archiwów.
+    """
+    log_path = LOG_DIR / LOG_FILE_NAME
+
+    if LOG_ROTATION == "time":
+        handler: logging.handlers.BaseRotatingHandler = logging.handlers.TimedRotatingFileHandler(
+            log_path, when="midnight", backupCount=LOG_BACKUP_COUNT, encoding="utf-8", utc=True
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
 
 def setup_logging() -> None:
     """
     Konfiguruje globalny system logowania aplikacji.
-    
+
     Logi są kierowane dwutorowo (Dual Logging):
-    1. Do pliku (logs/app.log) - w celu archiwizacji i późniejszej analizy.
+    1. Do pliku (logs/app.log) - z rotacją i kompresją archiwów (.gz).
     2. Na konsolę (stdout) - dla bieżącego podglądu działania aplikacji.
+
+    Zapis odbywa się asynchronicznie: wątki aplikacji jedynie wrzucają rekordy
+    do kolejki (QueueHandler), a dyskiem i konsolą zajmuje się osobny wątek
+    nasłuchujący (QueueListener). Dzięki temu cykl ETL nie blokuje się na I/O.
     """
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",  # Czysty format daty bez milisekund
-        handlers=[
-            logging.FileHandler(log_dir / "app.log", encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
\ No newline at end of file
+    global _listener
+
+    if _listener is not None:
+        return
+
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+
+    if LOG_FORMAT == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+    file_handler = _build_file_handler()
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY_N))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.handlers[:] = [queue_handler]
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+    # Opróżnienie kolejki przy zamknięciu procesu, aby nie zgubić ostatnich wpisów
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Zatrzymuje wątek nasłuchujący i zapisuje zaległe rekordy z kolejki."""
+    global _listener
+
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
@@ -2,7 +2,7 @@
 
 import time
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # Wczytanie zmiennych środowiskowych (bezpieczeństwo)
@@ -10,6 +10,7 @@ load_dotenv()
 
 # Importy modułów wewnętrznych
 from db_utils import init_db
+from spatial_index import rebuild_spatial_index
 from traffic_api import fetch_current_traffic, save_traffic
 from logger_config import setup_logging
 from backup_utils import perform_backup 
@@ -31,18 +32,43 @@ def check_for_alerts(traffic_data: List[Dict]) -> None:
     Analizuje pobrane dane pod kątem anomalii (silne korki).
     
     Jeśli 'jam_factor' przekroczy zdefiniowany próg, funkcja generuje
-    log poziomu WARNING oraz wyświetla komunikat operatorowi.
+    log poziomu WARNING (trafia on również na konsolę operatora).
     """
     for record in traffic_data:
         jam = record.get("jam_factor", 0.0)
-        loc = f"({record['lat']}, {record['lon']})"
         
         if jam >= JAM_ALERT_THRESHOLD:
-            msg = f"⚠️ ALERT: Wykryto duży zator {loc}! Poziom: {jam:.2f}"
-            logging.warning(msg)
-            print(msg) 
+            logging.warning("⚠️ ALERT: Wykryto duży zator (%s, %s)! Poziom: %.2f",
+                            record["lat"], record["lon"], jam)
         else:
-            logging.info(f"Ruch w normie {loc}. Jam Factor: {jam:.2f}")
+            # Komunikat z gorącej ścieżki: leniwe formatowanie + próbkowanie (SamplingFilter)
+            logging.info("Ruch w normie (%s, %s). Jam Factor: %.2f",
+                         record["lat"], record["lon"], jam, extra={"sampled": True})
+
+
+def run_etl_cycle(points: Optional[Dict[str, Tuple[float, float]]] = None) -> int:
+    """
+    Wykonuje pojedynczy cykl ETL: pobranie danych, zapis do bazy i analizę alertów.
+
+    Wydzielony z pętli głównej, aby ten sam przebieg mógł być uruchamiany
+    przez harness testów obciążeniowych (soak_test.py). Zwraca liczbę
+    zapisanych rekordów.
+    """
+    logging.info("--- START CYKLU ETL ---", extra={"sampled": True})
+    
+    # KROK 1: Extract & Load (Pobranie i zapis)
+    traffic_recs = fetch_current_traffic(points)
+    
+    if traffic_recs:
+        save_traffic(traffic_recs)
+        logging.info("Zapisano %d nowych rekordów ruchu.", len(traffic_recs), extra={"sampled": True})
+        
+        # KROK 2: Analiza w czasie rzeczywistym
+        check_for_alerts(traffic_recs)
+    else:
+        logging.warning("Brak danych z API w bieżącym cyklu.")
+
+    return len(traffic_recs)
 
 
 def main() -> None:
@@ -57,26 +83,19 @@ def main() -> None:
     # 2. Inicjalizacja struktury bazy danych
     init_db()
     
-    logging.info(f"Uruchomiono serwis monitoringu. Interwał: {CHECK_INTERVAL_SECONDS}s")
+    # 3. Indeks przestrzenny: przypisanie punktów pomiarowych do stacji pogodowych
+    assigned = rebuild_spatial_index()
+    logging.info("Indeks przestrzenny gotowy. Przypisane punkty: %d", assigned)
+    
+    logging.info("Uruchomiono serwis monitoringu. Interwał: %ss", CHECK_INTERVAL_SECONDS)
     print("🚀 System wystartował. Logi w katalogu /logs. Naciśnij Ctrl+C, aby zatrzymać.")
     
     cycle_count = 0 
 
     try:
         while True:
-            logging.info("--- START CYKLU ETL ---")
-            
-            # KROK 1: Extract & Load (Pobranie i zapis)
-            traffic_recs = fetch_current_traffic()
-            
-            if traffic_recs:
-                save_traffic(traffic_recs)
-                logging.info(f"Zapisano {len(traffic_recs)} nowych rekordów ruchu.")
-                
-                # KROK 2: Analiza w czasie rzeczywistym
-                check_for_alerts(traffic_recs)
-            else:
-                logging.warning("Brak danych z API w bieżącym cyklu.")
+            # KROK 1-2: Extract & Load, analiza w czasie rzeczywistym
+            run_etl_cycle()
 
             # KROK 3: Maintenance (Backupy)
             cycle_count += 1
@@ -86,7 +105,7 @@ def main() -> None:
                 cycle_count = 0 
 
             # Oczekiwanie na kolejny cykl
-            logging.info(f"Uśpienie procesu na {CHECK_INTERVAL_SECONDS}s...")
+            logging.info("Uśpienie procesu na %ss...", CHECK_INTERVAL_SECONDS, extra={"sampled": True})
             time.sleep(CHECK_INTERVAL_SECONDS)
 
     except KeyboardInterrupt:
@@ -0,0 +1,332 @@
+# soak_test.py
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from stub_server import StubSettings, TRAFFIC_PATH, WEATHER_PATH, STATS_PATH
+
+"""
+Harness testu obciążeniowego i długotrwałego (soak test) całego potoku ETL.
+
+Uruchamia lokalny stub usług (stub_server.py) w osobnym procesie, aby jego
+wątki i pamięć nie zaburzały pomiarów, kieruje na niego aplikację przez
+zmienne środowiskowe, a następnie przez zadany czas wykonuje cykle
+main_loop.run_etl_cycle dla tysięcy syntetycznych punktów (z backupem bazy
+co BACKUP_EVERY_N_CYCLES cykli, jak w main_loop.main) oraz równolegle
+scraping historii pogody. Raportuje przepustowość, percentyle czasu cyklu,
+przyrost pamięci i bazy danych, a na końcu porównuje wyniki z progami
+(kod wyjścia 0 = PASS, 1 = FAIL).
+"""
+
+# Środek obszaru generowania punktów (Opole) i promień rozrzutu w stopniach
+CENTER_LAT, CENTER_LON = 50.6751, 17.9213
+SPREAD_DEG = 0.1
+
+STUB_HOST = "127.0.0.1"
+STUB_START_TIMEOUT_S = 10.0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Soak / load test potoku ETL na lokalnym stubie.")
+    parser.add_argument("--duration-min", type=float, default=60.0, help="Czas trwania testu (minuty)")
+    parser.add_argument("--points", type=int, default=2000, help="Liczba syntetycznych punktów ruchu")
+    parser.add_argument("--workers", type=int, default=64,
+                        help="Wątki pobierające ruch (TRAFFIC_FETCH_WORKERS)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Docelowy odstęp między cyklami (s)")
+    parser.add_argument("--warmup-cycles", type=int, default=3, help="Cykle pomijane przy pomiarze pamięci")
+    parser.add_argument("--work-dir", default="soak_run", help="Katalog na bazę i logi testu (czyszczony)")
+    parser.add_argument("--log-level", default="WARNING")
+
+    stub = parser.add_argument_group("stub")
+    stub.add_argument("--latency-ms", type=float, default=StubSettings.latency_median_ms)
+    stub.add_argument("--rate-limit", type=float, default=StubSettings.rate_limit_prob)
+    stub.add_argument("--error-rate", type=float, default=StubSettings.error_prob)
+    stub.add_argument("--proxy-delay", type=float, default=StubSettings.proxy_delay_s)
+    stub.add_argument("--proxies", choices=("none", "slow", "fail", "mixed"), default="mixed",
+                      help="Zachowanie serwerów proxy scrapera pogody")
+    stub.add_argument("--no-weather", action="store_true", help="Wyłącz równoległy scraping pogody")
+    stub.add_argument("--weather-pause", type=float, default=0.5, help="Przerwa między dniami pogody (s)")
+
+    limits = parser.add_argument_group("progi PASS/FAIL")
+    limits.add_argument("--min-rps", type=float, default=200.0, help="Min. rekordów/s (średnio)")
+    limits.add_argument("--max-p95-ms", type=float, default=10000.0, help="Maks. p95 czasu cyklu (ms)")
+    limits.add_argument("--max-mem-growth-mb", type=float, default=50.0, help="Maks. przyrost RSS (MB)")
+    limits.add_argument("--min-success-rate", type=float, default=0.95, help="Min. odsetek udanych punktów")
+    limits.add_argument("--max-bytes-per-record", type=float, default=512.0, help="Maks. przyrost bazy na rekord")
+    return parser.parse_args()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentyl metodą najbliższego rangu (bez zależności od numpy)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def rss_mb() -> float:
+    """Bieżące zużycie pamięci RSS procesu (MB); poza Linuksem maksymalne RSS."""
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        pages = int(statm.read_text().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    import resource  # Moduł dostępny tylko w systemach uniksowych
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def make_points(count: int) -> Dict[str, Tuple[float, float]]:
+    """Generuje stały zbiór syntetycznych punktów pomiarowych wokół Opola."""
+    rng = random.Random(42)
+    return {
+        f"soak_{i:05d}": (
+            round(CENTER_LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG), 5),
+            round(CENTER_LON + rng.uniform(-SPREAD_DEG, SPREAD_DEG), 5),
+        )
+        for i in range(count)
+    }
+
+
+def _free_port() -> int:
+    """Zwraca wolny port TCP na interfejsie lokalnym."""
+    with socket.socket() as sock:
+        sock.bind((STUB_HOST, 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, proc: subprocess.Popen, timeout: float) -> None:
+    """Czeka, aż proces stubu zacznie przyjmować połączenia na porcie."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Proces stubu zakończył się z kodem {proc.returncode}")
+        try:
+            with socket.create_connection((STUB_HOST, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Stub nie nasłuchuje na porcie {port} po {timeout:.0f} s")
+
+
+def start_stub_process(args: argparse.Namespace) -> Tuple[subprocess.Popen, Dict[str, int]]:
+    """
+    Uruchamia stub_server.py jako osobny proces i czeka na jego gotowość.
+
+    Zwraca (proces, porty ról). Serwery proxy startują zawsze; o tym,
+    których używa scraper, decyduje configure_environment.
+    """
+    ports = {"origin": _free_port(), "slow": _free_port(), "fail": _free_port()}
+    cmd = [
+        sys.executable, str(Path(__file__).with_name("stub_server.py")),
+        "--host", STUB_HOST,
+        "--port", str(ports["origin"]),
+        "--slow-proxy-port", str(ports["slow"]),
+        "--fail-proxy-port", str(ports["fail"]),
+        "--latency-ms", str(args.latency_ms),
+        "--rate-limit", str(args.rate_limit),
+        "--error-rate", str(args.error_rate),
+        "--proxy-delay", str(args.proxy_delay),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    try:
+        for port in ports.values():
+            _wait_for_port(port, proc, STUB_START_TIMEOUT_S)
+    except RuntimeError:
+        proc.kill()
+        raise
+    return proc, ports
+
+
+def stub_stats(base: str) -> Dict[str, int]:
+    """Pobiera liczniki zapytań z procesu stubu (pusty słownik, gdy niedostępny)."""
+    try:
+        with urllib.request.urlopen(base + STATS_PATH, timeout=5) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def configure_environment(args: argparse.Namespace, work_dir: Path, ports: Dict[str, int]) -> str:
+    """
+    Ustawia zmienne środowiskowe odczytywane przez config.py tak, by wskazywały stub.
+
+    Musi zostać wywołane przed importem modułów aplikacji. Zwraca bazowy adres stubu.
+    """
+    base = f"http://{STUB_HOST}:{ports['origin']}"
+    proxies = []
+    if args.proxies in ("slow", "mixed"):
+        proxies.append(f"http://{STUB_HOST}:{ports['slow']}")
+    if args.proxies in ("fail", "mixed"):
+        proxies.append(f"http://{STUB_HOST}:{ports['fail']}")
+
+    os.environ["TOMTOM_API_URL"] = base + TRAFFIC_PATH
+    os.environ["WEATHER_BASE_URL"] = base + WEATHER_PATH
+    os.environ["WEATHER_PROXIES"] = ",".join(proxies)
+    os.environ["TRAFFIC_FETCH_WORKERS"] = str(args.workers)
+    os.environ.setdefault("TOMTOM_API_KEY", "soak-test-key")
+    os.environ["DB_DIR"] = str(work_dir / "db")
+    os.environ["LOG_DIR"] = str(work_dir / "logs")
+    os.environ["BACKUP_DIR"] = str(work_dir / "backups")
+    os.environ["LOG_LEVEL"] = args.log_level
+    return base
+
+
+def weather_worker(stop: threading.Event, pause: float, counters: Dict[str, int]) -> None:
+    """Równoległy scraping kolejnych dni (jak history_weather_2024.py obok main_loop)."""
+    from weather_scraper import scrape_day
+
+    day = date(2024, 1, 1)
+    while not stop.is_set():
+        status = scrape_day(day)
+        counters[status] = counters.get(status, 0) + 1
+        day += timedelta(days=1)
+        stop.wait(pause)
+
+
+def run_soak(args: argparse.Namespace, stub_base: str) -> int:
+    """Wykonuje cykle ETL do upływu czasu testu, raportuje metryki i zwraca kod wyjścia."""
+    # Importy aplikacji dopiero po ustawieniu środowiska (config.py czyta je przy imporcie)
+    from config import DB_PATH
+    from db_utils import init_db
+    from logger_config import setup_logging
+    from backup_utils import perform_backup
+    from main_loop import run_etl_cycle, BACKUP_EVERY_N_CYCLES
+    from weather_coverage import init_coverage
+
+    setup_logging()
+    init_db()
+    init_coverage()
+
+    points = make_points(args.points)
+    deadline = time.monotonic() + args.duration_min * 60.0
+
+    stop = threading.Event()
+    weather_counts: Dict[str, int] = {}
+    weather_thread = None
+    if not args.no_weather:
+        weather_thread = threading.Thread(
+            target=weather_worker, args=(stop, args.weather_pause, weather_counts),
+            name="soak-weather", daemon=True,
+        )
+        weather_thread.start()
+
+    print(f"🧪 Soak test: {args.points} punktów, {args.duration_min} min, baza: {DB_PATH}")
+
+    cycle_times: List[float] = []
+    backup_times: List[float] = []
+    records = 0
+    mem_baseline = rss_mb()
+    mem_peak = mem_baseline
+    db_baseline = 0
+    records_at_baseline = 0
+    started = time.monotonic()
+
+    while time.monotonic() < deadline:
+        t0 = time.perf_counter()
+        records += run_etl_cycle(points)
+
+        # Backup bazy w tym samym harmonogramie co main_loop.main (wliczany do czasu cyklu)
+        if (len(cycle_times) + 1) % BACKUP_EVERY_N_CYCLES == 0:
+            b0 = time.perf_counter()
+            perform_backup()
+            backup_times.append(time.perf_counter() - b0)
+
+        elapsed = time.perf_counter() - t0
+        cycle_times.append(elapsed)
+
+        if len(cycle_times) == args.warmup_cycles:
+            mem_baseline = rss_mb()
+            db_baseline = DB_PATH.stat().st_size
+            records_at_baseline = records
+        mem_peak = max(mem_peak, rss_mb())
+
+        if len(cycle_times) % 10 == 0:
+            print(f"   cykl {len(cycle_times)}: {elapsed * 1000:.0f} ms, rekordy: {records}, RSS: {rss_mb():.1f} MB")
+
+        time.sleep(max(0.0, args.interval - elapsed))
+
+    total_s = time.monotonic() - started
+    stop.set()
+    if weather_thread:
+        weather_thread.join(timeout=60)
+
+    # --- Metryki ---
+    cycles = len(cycle_times)
+    rps = records / total_s if total_s else 0.0
+    success_rate = records / (cycles * len(points)) if cycles and points else 0.0
+    p50, p95, p99 = (percentile(cycle_times, p) * 1000 for p in (50, 95, 99))
+    backup_p95 = percentile(backup_times, 95) * 1000
+    backup_max = max(backup_times, default=0.0) * 1000
+    mem_end = rss_mb()
+    mem_growth = mem_end - mem_baseline
+    db_end = DB_PATH.stat().st_size
+    measured_records = records - records_at_baseline
+    bytes_per_record = (db_end - db_baseline) / measured_records if measured_records else 0.0
+
+    print("\n📊 Wyniki soak testu")
+    print("-" * 55)
+    print(f"{'Czas trwania':<28} | {total_s:.1f} s ({cycles} cykli)")
+    print(f"{'Rekordy ruchu':<28} | {records} ({rps:.1f} rek/s)")
+    print(f"{'Udane punkty':<28} | {success_rate:.2%}")
+    print(f"{'Czas cyklu p50/p95/p99':<28} | {p50:.0f} / {p95:.0f} / {p99:.0f} ms")
+    print(f"{'Backupy (liczba, p95/maks)':<28} | {len(backup_times)}, {backup_p95:.0f} / {backup_max:.0f} ms")
+    print(f"{'Pamięć RSS (start/koniec)':<28} | {mem_baseline:.1f} / {mem_end:.1f} MB (szczyt {mem_peak:.1f})")
+    print(f"{'Rozmiar bazy':<28} | {db_end / 1024 / 1024:.1f} MB ({bytes_per_record:.0f} B/rekord)")
+    print(f"{'Dni pogody (statusy)':<28} | {weather_counts}")
+    print(f"{'Zapytania do stubu':<28} | {stub_stats(stub_base)}")
+
+    checks = [
+        ("rekordy/s", rps >= args.min_rps, f"{rps:.1f} >= {args.min_rps}"),
+        ("p95 cyklu", p95 <= args.max_p95_ms, f"{p95:.0f} ms <= {args.max_p95_ms} ms"),
+        ("przyrost pamięci", mem_growth <= args.max_mem_growth_mb,
+         f"{mem_growth:.1f} MB <= {args.max_mem_growth_mb} MB"),
+        ("udane punkty", success_rate >= args.min_success_rate,
+         f"{success_rate:.2%} >= {args.min_success_rate:.0%}"),
+        ("bajty/rekord", bytes_per_record <= args.max_bytes_per_record,
+         f"{bytes_per_record:.0f} <= {args.max_bytes_per_record}"),
+    ]
+
+    print("-" * 55)
+    for name, ok, detail in checks:
+        print(f"{'✅ PASS' if ok else '❌ FAIL'}  {name:<18} {detail}")
+
+    passed = all(ok for _, ok, _ in checks)
+    logging.info("Soak test zakończony: %s", "PASS" if passed else "FAIL")
+    return 0 if passed else 1
+
+
+def main() -> int:
+    args = parse_args()
+
+    work_dir = Path(args.work_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    stub, ports = start_stub_process(args)
+    try:
+        stub_base = configure_environment(args, work_dir, ports)
+        return run_soak(args, stub_base)
+    finally:
+        stub.terminate()
+        try:
+            stub.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            stub.kill()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
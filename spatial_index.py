@@ -0,0 +1,336 @@
+# spatial_index.py
+
+import logging
+import math
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db_utils import get_connection
+from config import TRAFFIC_POINTS, WEATHER_SITES, SITE_MATCH_MAX_KM
+
+"""
+Indeks przestrzenny punktów pomiarowych ruchu i stacji pogodowych.
+
+Wykorzystuje moduł R*Tree wbudowany w SQLite: każdy punkt zapisywany jest
+jako zdegenerowany prostokąt (min = max), co pozwala zapytaniom o otoczenie
+(bounding box) korzystać z indeksu zamiast skanować całą tabelę. Dokładna
+odległość (haversine) liczona jest tylko dla kandydatów zwróconych przez R*Tree.
+"""
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Początkowy promień wyszukiwania najbliższej stacji (podwajany aż do limitu)
+NEAREST_START_RADIUS_KM = 1.0
+
+# Tabele lokalizacji i odpowiadające im indeksy R*Tree
+SITE_TABLES = {
+    "traffic_points": "traffic_points_rtree",
+    "weather_sites": "weather_sites_rtree",
+}
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Odległość po kole wielkim między dwoma punktami (w kilometrach)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Wyznacza prostokąt (min_lat, max_lat, min_lon, max_lon) opisany na okręgu.
+
+    Zakresy liczone są na tej samej sferze co haversine_km, więc prostokąt
+    zawsze obejmuje cały okrąg. Zakres lon to maksymalne odchylenie
+    długości geograficznej na okręgu: asin(sin(r/R) / cos(lat)).
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    d_lat = math.degrees(angular)
+    cos_lat = math.cos(math.radians(lat))
+    ratio = math.sin(angular) / cos_lat if cos_lat > 1e-12 else 2.0
+    # Okrąg obejmujący biegun: pełny zakres długości geograficznej
+    d_lon = math.degrees(math.asin(ratio)) if ratio < 1.0 else 180.0
+    return lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon
+
+
+def init_spatial_index() -> None:
+    """
+    Tworzy tabele lokalizacji, indeksy R*Tree oraz tabelę przypisań punkt -> stacja.
+
+    Tabela 'point_site_map' przechowuje wstępnie wyliczone przypisania,
+    dzięki czemu zapytania analityczne łączą dane po kluczach całkowitych
+    zamiast liczyć odległości dla każdego wiersza.
+    """
+    conn = get_connection()
+    cur = conn.cursor()
+
+    for table, rtree in SITE_TABLES.items():
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                UNIQUE (lat, lon)
+            );
+        """)
+        cur.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {rtree}
+            USING rtree(id, min_lat, max_lat, min_lon, max_lon);
+        """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS point_site_map (
+            point_id INTEGER PRIMARY KEY REFERENCES traffic_points(id),
+            site_id INTEGER NOT NULL REFERENCES weather_sites(id),
+            distance_km REAL NOT NULL
+        );
+    """)
+
+    # Widok mapujący wiersze 'traffic' na stację pogodową (wyłącznie klucze całkowite).
+    # DROP + CREATE podmienia starszą definicję łączącą po współrzędnych.
+    cur.execute("DROP VIEW IF EXISTS traffic_site;")
+    cur.execute("""
+        CREATE VIEW traffic_site AS
+        SELECT t.id AS traffic_id, t.point_id, m.site_id, m.distance_km
+        FROM traffic t
+        JOIN point_site_map m ON m.point_id = t.point_id;
+    """)
+
+    # Odczyt obserwacji jednej stacji w kolejności czasu (złączenie as-of per stacja)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_weather_site_time ON weather(lat, lon, timestamp);")
+
+    conn.commit()
+    conn.close()
+
+
+def _register(conn: sqlite3.Connection, table: str, name: Optional[str],
+              lat: float, lon: float) -> Tuple[int, bool]:
+    """Dodaje lokalizację (jeśli nowa) do tabeli i jej indeksu R*Tree. Zwraca (ID, czy_nowa)."""
+    cur = conn.cursor()
+    cur.execute(f"SELECT id FROM {table} WHERE lat = ? AND lon = ?", (lat, lon))
+    row = cur.fetchone()
+    if row:
+        if name:
+            cur.execute(f"UPDATE {table} SET name = ? WHERE id = ? AND name IS NULL", (name, row[0]))
+        return row[0], False
+
+    cur.execute(f"INSERT INTO {table} (name, lat, lon) VALUES (?, ?, ?)", (name, lat, lon))
+    site_id = cur.lastrowid
+    cur.execute(
+        f"INSERT INTO {SITE_TABLES[table]} (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+        (site_id, lat, lat, lon, lon),
+    )
+    return site_id, True
+
+
+def _assign_point(conn: sqlite3.Connection, point_id: int, lat: float, lon: float,
+                  max_km: float = SITE_MATCH_MAX_KM) -> bool:
+    """Zapisuje przypisanie punktu do najbliższej stacji pogodowej. Zwraca False, gdy brak stacji."""
+    match = nearest_weather_site(conn, lat, lon, max_km)
+    if match is None:
+        logging.warning("Brak stacji pogodowej w promieniu %.1f km od punktu %d.", max_km, point_id)
+        return False
+    conn.execute(
+        "INSERT OR REPLACE INTO point_site_map (point_id, site_id, distance_km) VALUES (?, ?, ?)",
+        (point_id, match[0], match[1]),
+    )
+    return True
+
+
+def register_traffic_point(conn: sqlite3.Connection, lat: float, lon: float, name: Optional[str] = None) -> int:
+    """
+    Rejestruje punkt pomiarowy ruchu w indeksie przestrzennym.
+
+    Nowy punkt od razu otrzymuje przypisanie do najbliższej stacji pogodowej.
+    """
+    point_id, created = _register(conn, "traffic_points", name, lat, lon)
+    if created:
+        _assign_point(conn, point_id, lat, lon)
+    return point_id
+
+
+# Pamięć podręczna (lat, lon) -> traffic_points.id dla zapisu rekordów ruchu
+_point_id_cache: Dict[Tuple[float, float], int] = {}
+
+
+def resolve_point_ids(conn: sqlite3.Connection, coords: Iterable[Tuple[float, float]]) -> List[int]:
+    """
+    Zwraca klucze punktów pomiarowych dla listy współrzędnych, rejestrując nowe punkty.
+
+    Wywoływane przy zapisie rekordów ruchu (save_traffic, import archiwów),
+    w ramach transakcji zapisu. Po wycofaniu takiej transakcji należy
+    wywołać reset_point_cache(), bo nowo nadane ID przestają istnieć.
+    """
+    ids = []
+    for lat, lon in coords:
+        point_id = _point_id_cache.get((lat, lon))
+        if point_id is None:
+            point_id = register_traffic_point(conn, lat, lon)
+            _point_id_cache[(lat, lon)] = point_id
+        ids.append(point_id)
+    return ids
+
+
+def reset_point_cache() -> None:
+    """Czyści pamięć podręczną kluczy punktów (po rollbacku transakcji zapisu)."""
+    _point_id_cache.clear()
+
+
+def register_weather_site(conn: sqlite3.Connection, lat: float, lon: float, name: Optional[str] = None) -> int:
+    """
+    Rejestruje stację (źródło) danych pogodowych w indeksie przestrzennym.
+
+    Nowa stacja może zmienić najbliższe przypisania punktów, dlatego po
+    dodaniu stacji należy wywołać assign_points_to_sites().
+    """
+    return _register(conn, "weather_sites", name, lat, lon)[0]
+
+
+def _within(conn: sqlite3.Connection, table: str, lat: float, lon: float,
+            radius_km: float) -> List[Tuple[int, float]]:
+    """Zwraca (id, odległość_km) lokalizacji z 'table' w promieniu radius_km, posortowane rosnąco."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT s.id, s.lat, s.lon
+        FROM {SITE_TABLES[table]} r
+        JOIN {table} s ON s.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ?
+          AND r.max_lon >= ? AND r.min_lon <= ?
+    """, (min_lat, max_lat, min_lon, max_lon))
+
+    # Filtr dokładny: prostokąt zawiera też narożniki spoza okręgu
+    hits = []
+    for site_id, s_lat, s_lon in cur.fetchall():
+        dist = haversine_km(lat, lon, s_lat, s_lon)
+        if dist <= radius_km:
+            hits.append((site_id, dist))
+    hits.sort(key=lambda h: h[1])
+    return hits
+
+
+def weather_sites_within(conn: sqlite3.Connection, lat: float, lon: float,
+                         radius_km: float) -> List[Tuple[int, float]]:
+    """Stacje pogodowe w promieniu radius_km od punktu (id, odległość_km)."""
+    return _within(conn, "weather_sites", lat, lon, radius_km)
+
+
+def traffic_points_within(conn: sqlite3.Connection, lat: float, lon: float,
+                          radius_km: float) -> List[Tuple[int, float]]:
+    """Punkty pomiarowe ruchu w promieniu radius_km od punktu (id, odległość_km)."""
+    return _within(conn, "traffic_points", lat, lon, radius_km)
+
+
+def nearest_weather_site(conn: sqlite3.Connection, lat: float, lon: float,
+                         max_km: float = SITE_MATCH_MAX_KM) -> Optional[Tuple[int, float]]:
+    """
+    Znajduje najbliższą stację pogodową (id, odległość_km) nie dalej niż max_km.
+
+    Promień wyszukiwania jest podwajany, zaczynając od NEAREST_START_RADIUS_KM,
+    więc w gęstej sieci stacji R*Tree zwraca tylko kilku kandydatów.
+    """
+    radius = min(NEAREST_START_RADIUS_KM, max_km)
+    while True:
+        hits = weather_sites_within(conn, lat, lon, radius)
+        if hits:
+            return hits[0]
+        if radius >= max_km:
+            return None
+        radius = min(radius * 2, max_km)
+
+
+def sync_sites() -> None:
+    """
+    Rejestruje lokalizacje z konfiguracji.
+
+    Punkty spoza konfiguracji rejestrowane są przy zapisie rekordów ruchu
+    (resolve_point_ids), więc start aplikacji nie skanuje tabel z danymi.
+    """
+    conn = get_connection()
+    try:
+        # Stacje najpierw: nowe punkty od razu dostają przypisanie
+        for name, (lat, lon) in WEATHER_SITES.items():
+            register_weather_site(conn, lat, lon, name)
+        for name, (lat, lon) in TRAFFIC_POINTS.items():
+            register_traffic_point(conn, lat, lon, name)
+
+        conn.commit()
+    except sqlite3.Error as e:
+        logging.error("Błąd synchronizacji indeksu przestrzennego: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def assign_points_to_sites(max_km: float = SITE_MATCH_MAX_KM) -> int:
+    """
+    Przelicza przypisania punkt ruchu -> najbliższa stacja pogodowa.
+
+    Wynik trafia do tabeli 'point_site_map'. Punkty bez stacji w zasięgu
+    max_km nie są przypisywane. Zwraca liczbę przypisanych punktów.
+    """
+    conn = get_connection()
+    assigned = 0
+    try:
+        cur = conn.cursor()
+        points = cur.execute("SELECT id, lat, lon FROM traffic_points").fetchall()
+
+        cur.execute("DELETE FROM point_site_map")
+        for point_id, lat, lon in points:
+            if _assign_point(conn, point_id, lat, lon, max_km):
+                assigned += 1
+
+        conn.commit()
+    except sqlite3.Error as e:
+        logging.error("Błąd przeliczania przypisań punkt -> stacja: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    return assigned
+
+
+def backfill_point_ids() -> None:
+    """
+    Jednorazowo uzupełnia traffic.point_id dla wierszy sprzed migracji.
+
+    Wymaga pełnego skanu tabeli 'traffic', dlatego wywoływana jest tylko
+    przez init_db() w chwili dodania kolumny, a nie przy każdym starcie.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        coords = cur.execute("SELECT DISTINCT lat, lon FROM traffic WHERE point_id IS NULL").fetchall()
+        for lat, lon in coords:
+            register_traffic_point(conn, lat, lon)
+        cur.execute("""
+            UPDATE traffic SET point_id = (
+                SELECT p.id FROM traffic_points p WHERE p.lat = traffic.lat AND p.lon = traffic.lon
+            )
+            WHERE point_id IS NULL
+        """)
+        conn.commit()
+        logging.info("Uzupełniono klucze punktów dla %d lokalizacji.", len(coords))
+    except sqlite3.Error as e:
+        logging.error("Błąd uzupełniania traffic.point_id: %s", e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def rebuild_spatial_index() -> int:
+    """Tworzy strukturę, synchronizuje lokalizacje i przelicza przypisania."""
+    init_spatial_index()
+    sync_sites()
+    return assign_points_to_sites()
+
+
+if __name__ == "__main__":
+    from db_utils import init_db
+
+    init_db()
+    count = rebuild_spatial_index()
+    print(f"✅ Indeks przestrzenny przebudowany. Przypisane punkty: {count}")
@@ -0,0 +1,231 @@
+# stub_server.py
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+"""
+Lokalny stub usług zewnętrznych (TomTom Flow Segment Data + timeanddate.com).
+
+Służy do testów obciążeniowych i długotrwałych (soak) bez wywoływania
+prawdziwych serwisów. Symuluje opóźnienia odpowiedzi (rozkład log-normalny),
+limity zapytań (HTTP 429), błędy serwera (HTTP 5xx) oraz wolne lub
+niedziałające serwery proxy. Adresy usług wskazuje się aplikacji przez
+zmienne TOMTOM_API_URL, WEATHER_BASE_URL i WEATHER_PROXIES (config.py).
+"""
+
+# Role instancji serwera
+ROLE_ORIGIN = "origin"          # Właściwy stub API / strony
+ROLE_PROXY_SLOW = "proxy_slow"  # Proxy odpowiadające z dużym opóźnieniem
+ROLE_PROXY_FAIL = "proxy_fail"  # Proxy zwracające zawsze HTTP 502
+
+TRAFFIC_PATH = "/traffic/services/4/flowSegmentData/absolute/10/json"
+WEATHER_PATH = "/weather"
+STATS_PATH = "/__stub/stats"  # Liczniki zapytań (JSON) dla harnessu w innym procesie
+
+WEATHER_DESCRIPTIONS = ["Sunny.", "Passing clouds.", "Overcast.", "Light rain.", "Fog.", "Snow flurries."]
+
+
+@dataclass
+class StubSettings:
+    """Parametry symulacji zachowania usług zewnętrznych."""
+    latency_median_ms: float = 40.0
+    latency_sigma: float = 0.6          # Rozrzut rozkładu log-normalnego
+    rate_limit_prob: float = 0.01       # Prawdopodobieństwo odpowiedzi 429
+    error_prob: float = 0.005           # Prawdopodobieństwo odpowiedzi 503
+    proxy_delay_s: float = 8.0          # Opóźnienie wolnego proxy (powyżej timeoutu scrapera)
+    weather_rows_per_day: int = 48      # Obserwacje co 30 minut
+
+
+class StubStats:
+    """Bezpieczne wątkowo liczniki obsłużonych zapytań."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def incr(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+def _point_seed(point: str) -> int:
+    """Stabilne ziarno losowości dla punktu (ta sama prędkość swobodna między cyklami)."""
+    return zlib.crc32(point.encode("utf-8"))
+
+
+def build_flow_payload(point: str) -> Dict:
+    """Generuje odpowiedź Flow Segment Data dla wskazanego punktu 'lat,lon'."""
+    free_flow = 30 + _point_seed(point) % 60
+    current = round(free_flow * random.uniform(0.15, 1.0), 1)
+    return {
+        "flowSegmentData": {
+            "frc": "FRC2",
+            "currentSpeed": current,
+            "freeFlowSpeed": free_flow,
+            "currentTravelTime": 60,
+            "freeFlowTravelTime": 45,
+            "confidence": round(random.uniform(0.7, 1.0), 2),
+            "roadClosure": False,
+        }
+    }
+
+
+def build_weather_html(d: date, rows: int) -> str:
+    """Generuje stronę z tabelą 'wt-his' w układzie oczekiwanym przez weather_scraper."""
+    rng = random.Random(d.toordinal())
+    step = max(1, 24 * 60 // rows)
+    lines = [
+        '<html><body><table id="wt-his">',
+        "<tr><th>Time</th><th></th><th>Temp</th><th>Weather</th><th>Wind</th>"
+        "<th>Humidity</th><th>Barometer</th><th>Visibility</th></tr>",
+    ]
+    for minute in range(0, 24 * 60, step):
+        lines.append(
+            f"<tr><th>{minute // 60:02d}:{minute % 60:02d}<br>{d.strftime('%a, %d %b')}</th>"
+            f"<td><img></td>"
+            f"<td>{rng.randint(-10, 30)} °C</td>"
+            f"<td>{rng.choice(WEATHER_DESCRIPTIONS)}</td>"
+            f"<td>{rng.randint(0, 40)} km/h</td>"
+            f"<td>{rng.randint(40, 100)}%</td>"
+            f"<td>{rng.randint(990, 1035)} mbar</td>"
+            f"<td>{rng.randint(1, 10)} km</td></tr>"
+        )
+    lines.append("</table></body></html>")
+    return "\n".join(lines)
+
+
+def make_handler(role: str, settings: StubSettings, stats: StubStats) -> type:
+    """Tworzy klasę obsługi zapytań skonfigurowaną dla danej roli serwera."""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, jak w prawdziwych usługach
+
+        def log_message(self, format: str, *args) -> None:
+            # Logi dostępu wyłączone: przy tysiącach zapytań zaciemniałyby wyniki
+            pass
+
+        def _send(self, status: int, body: str, content_type: str = "text/plain",
+                  headers: Optional[Dict[str, str]] = None) -> None:
+            payload = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:
+            # Zapytania przez proxy HTTP przychodzą z pełnym adresem URL w ścieżce
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+
+            if role == ROLE_PROXY_FAIL:
+                stats.incr("proxy_fail")
+                self._send(502, "Bad Gateway")
+                return
+            if role == ROLE_PROXY_SLOW:
+                stats.incr("proxy_slow")
+                time.sleep(settings.proxy_delay_s)
+
+            if parsed.path == STATS_PATH:
+                self._send(200, json.dumps(stats.snapshot()), "application/json")
+                return
+
+            if parsed.path == "/robots.txt":
+                stats.incr("robots")
+                self._send(200, "User-agent: *\nAllow: /\n")
+                return
+
+            time.sleep(random.lognormvariate(math.log(settings.latency_median_ms / 1000.0),
+                                             settings.latency_sigma))
+
+            if random.random() < settings.rate_limit_prob:
+                stats.incr("429")
+                self._send(429, "Too Many Requests", headers={"Retry-After": "1"})
+                return
+            if random.random() < settings.error_prob:
+                stats.incr("503")
+                self._send(503, "Service Unavailable")
+                return
+
+            if parsed.path == TRAFFIC_PATH:
+                stats.incr("traffic")
+                point = query.get("point", ["0,0"])[0]
+                self._send(200, json.dumps(build_flow_payload(point)), "application/json")
+            elif parsed.path.startswith(WEATHER_PATH) and parsed.path.endswith("/historic"):
+                stats.incr("weather")
+                hd = query.get("hd", [""])[0]
+                try:
+                    d = date(int(hd[:4]), int(hd[4:6]), int(hd[6:8]))
+                except ValueError:
+                    self._send(400, "Bad date")
+                    return
+                self._send(200, build_weather_html(d, settings.weather_rows_per_day), "text/html")
+            else:
+                stats.incr("404")
+                self._send(404, "Not Found")
+
+    return StubHandler
+
+
+def start_stub(role: str = ROLE_ORIGIN, settings: Optional[StubSettings] = None,
+               host: str = "127.0.0.1", port: int = 0, stats: Optional[StubStats] = None) -> ThreadingHTTPServer:
+    """
+    Uruchamia serwer stub w wątku w tle i zwraca instancję serwera.
+
+    Port 0 oznacza losowy wolny port (odczytywany z server.server_address).
+    Liczniki zapytań dostępne są w atrybucie 'stub_stats' serwera.
+    """
+    settings = settings or StubSettings()
+    stats = stats or StubStats()
+    server = ThreadingHTTPServer((host, port), make_handler(role, settings, stats))
+    server.daemon_threads = True
+    server.stub_stats = stats
+    threading.Thread(target=server.serve_forever, name=f"stub-{role}", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokalny stub TomTom / timeanddate.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--slow-proxy-port", type=int, default=8081)
+    parser.add_argument("--fail-proxy-port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=float, default=StubSettings.latency_median_ms)
+    parser.add_argument("--rate-limit", type=float, default=StubSettings.rate_limit_prob)
+    parser.add_argument("--error-rate", type=float, default=StubSettings.error_prob)
+    parser.add_argument("--proxy-delay", type=float, default=StubSettings.proxy_delay_s)
+    args = parser.parse_args()
+
+    cfg = StubSettings(latency_median_ms=args.latency_ms, rate_limit_prob=args.rate_limit,
+                       error_prob=args.error_rate, proxy_delay_s=args.proxy_delay)
+    shared_stats = StubStats()  # Wspólne liczniki: GET {STATS_PATH} na porcie origin
+    start_stub(ROLE_PROXY_SLOW, cfg, args.host, args.slow_proxy_port, shared_stats)
+    start_stub(ROLE_PROXY_FAIL, cfg, args.host, args.fail_proxy_port, shared_stats)
+    origin = start_stub(ROLE_ORIGIN, cfg, args.host, args.port, shared_stats)
+
+    base = f"http://{args.host}:{args.port}"
+    print("🧪 Stub uruchomiony. Ustaw zmienne środowiskowe:")
+    print(f"   TOMTOM_API_URL={base}{TRAFFIC_PATH}")
+    print(f"   WEATHER_BASE_URL={base}{WEATHER_PATH}")
+    print(f"   WEATHER_PROXIES=http://{args.host}:{args.slow_proxy_port},http://{args.host}:{args.fail_proxy_port}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print(f"\nStatystyki: {origin.stub_stats.snapshot()}")
@@ -2,38 +2,75 @@
 
 import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
 from db_utils import get_connection
-from config import TRAFFIC_POINTS, TOMTOM_API_URL, LAT_OP, LON_OP, TOMTOM_API_KEY
+from spatial_index import resolve_point_ids, reset_point_cache
+from config import (
+    ACTIVE_POINT_KEY, TOMTOM_API_URL, LAT_OP, LON_OP, TOMTOM_API_KEY, TRAFFIC_FETCH_WORKERS,
+)
 
-def fetch_current_traffic() -> List[Dict[str, Any]]:
+# Sesje HTTP (keep-alive) utrzymywane osobno dla każdego wątku roboczego
+_thread_local = threading.local()
+
+# Pula wątków pobierających, wspólna dla całego procesu: wątki (a wraz z nimi
+# ich sesje i otwarte połączenia) przeżywają kolejne cykle ETL
+_fetch_pool = ThreadPoolExecutor(max_workers=max(1, TRAFFIC_FETCH_WORKERS), thread_name_prefix="traffic-fetch")
+
+
+def _get_session() -> requests.Session:
+    """Zwraca sesję HTTP przypisaną do bieżącego wątku (ponowne użycie połączeń TCP)."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+
+def compute_jam_factor(speed: Optional[float], free_flow_speed: Optional[float]) -> float:
     """
-    Pobiera aktualne dane o płynności ruchu z API TomTom.
-    
-    Wykonuje zapytanie HTTP GET do endpointu Flow Segment Data.
-    Oblicza autorski wskaźnik 'jam_factor' na podstawie różnicy
-    między prędkością aktualną a swobodną (Free Flow Speed).
+    Oblicza autorski wskaźnik 'jam_factor' (0-10).
+
+    Wzór: Im wolniej jedziemy względem normy (Free Flow Speed), tym wyższy współczynnik.
+    """
+    if free_flow_speed and free_flow_speed > 0:
+        ratio = (speed or 0.1) / free_flow_speed
+        return 10.0 * max(0.0, 1.0 - ratio)
+    return 0.0
+
+
+def compute_jam_factors(speeds: Sequence[Optional[float]],
+                        free_flow_speeds: Sequence[Optional[float]]) -> List[float]:
+    """Wsadowa wersja compute_jam_factor dla całej paczki rekordów (import archiwów)."""
+    return list(map(compute_jam_factor, speeds, free_flow_speeds))
+
+
+def fetch_point_traffic(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """
+    Pobiera dane o płynności ruchu dla jednego punktu z API TomTom.
+
+    Zwraca rekord gotowy do zapisu lub None w razie błędu komunikacji.
     """
-    
     # Parametry zapytania zgodne z dokumentacją TomTom API
     params = {
-        "point": f"{LAT_OP},{LON_OP}",
+        "point": f"{lat},{lon}",
         "unit": "KMPH",     # Jednostka: km/h
         "key": TOMTOM_API_KEY,
     }
 
     try:
         # Timeout 10s zapobiega zawieszeniu aplikacji przy problemach z siecią
-        resp = requests.get(TOMTOM_API_URL, params=params, timeout=10)
+        resp = _get_session().get(TOMTOM_API_URL, params=params, timeout=10)
         resp.raise_for_status() # Rzuci wyjątek dla błędów 4xx/5xx
         
         data = resp.json()
 
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Błąd komunikacji z API TomTom: {e}")
-        return []
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logging.error("Błąd komunikacji z API TomTom: %s", e)
+        return None
 
     # Parsowanie odpowiedzi JSON
     flow = data.get("flowSegmentData", {})
@@ -44,19 +81,14 @@ def fetch_current_traffic() -> List[Dict[str, Any]]:
     confidence = flow.get("confidence", 0.0)
 
     # --- Feature Engineering: Jam Factor Calculation ---
-    # Wzór: Im wolniej jedziemy względem normy, tym wyższy współczynnik (0-10)
-    if free_flow_speed and free_flow_speed > 0:
-        ratio = (speed or 0.1) / free_flow_speed
-        jam_factor = 10.0 * max(0.0, 1.0 - ratio)
-    else:
-        jam_factor = 0.0
+    jam_factor = compute_jam_factor(speed, free_flow_speed)
 
     now_iso = datetime.now(timezone.utc).isoformat(timespec="seconds")
 
-    record = {
+    return {
         "timestamp": now_iso,
-        "lat": LAT_OP,
-        "lon": LON_OP,
+        "lat": lat,
+        "lon": lon,
         "speed": speed,
         "speed_limit": free_flow_speed,
         "jam_factor": jam_factor,
@@ -64,7 +96,27 @@ def fetch_current_traffic() -> List[Dict[str, Any]]:
         "provider": "tomtom_flow",
     }
 
-    return [record]
+
+def fetch_current_traffic(points: Optional[Dict[str, Tuple[float, float]]] = None) -> List[Dict[str, Any]]:
+    """
+    Pobiera aktualne dane o płynności ruchu z API TomTom.
+    
+    Wykonuje zapytanie HTTP GET do endpointu Flow Segment Data dla każdego
+    punktu (domyślnie tylko aktywny punkt z konfiguracji). Przy wielu punktach
+    zapytania wykonywane są równolegle we wspólnej puli TRAFFIC_FETCH_WORKERS
+    wątków.
+    Punkty, dla których zapytanie się nie powiodło, są pomijane.
+    """
+    if points is None:
+        points = {ACTIVE_POINT_KEY: (LAT_OP, LON_OP)}
+
+    coords = list(points.values())
+    if len(coords) == 1 or TRAFFIC_FETCH_WORKERS <= 1:
+        results = [fetch_point_traffic(lat, lon) for lat, lon in coords]
+    else:
+        results = list(_fetch_pool.map(lambda c: fetch_point_traffic(*c), coords))
+
+    return [r for r in results if r is not None]
 
 
 def save_traffic(records: List[Dict[str, Any]]) -> None:
@@ -77,24 +129,27 @@ def save_traffic(records: List[Dict[str, Any]]) -> None:
     conn = get_connection()
     try:
         cur = conn.cursor()
-        
+
+        # Klucz punktu nadawany przy zapisie (nowe punkty trafiają do indeksu przestrzennego)
+        point_ids = resolve_point_ids(conn, [(r["lat"], r["lon"]) for r in records])
+
         query = """
             INSERT INTO traffic (
                 timestamp, lat, lon, speed, speed_limit,
-                jam_factor, confidence, provider
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                jam_factor, confidence, provider, point_id
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
 
-        for r in records:
-            cur.execute(query, (
-                r["timestamp"], r["lat"], r["lon"],
-                r["speed"], r["speed_limit"],
-                r["jam_factor"], r["confidence"], r["provider"],
-            ))
+        cur.executemany(query, [(
+            r["timestamp"], r["lat"], r["lon"],
+            r["speed"], r["speed_limit"],
+            r["jam_factor"], r["confidence"], r["provider"], point_id,
+        ) for r, point_id in zip(records, point_ids)])
 
         conn.commit()
     except Exception as e:
-        logging.error(f"Błąd zapisu do bazy danych: {e}")
+        logging.error("Błąd zapisu do bazy danych: %s", e)
         conn.rollback() # Wycofanie zmian w razie błędu
+        reset_point_cache()
     finally:
         conn.close()
\ No newline at end of file
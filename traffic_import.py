@@ -0,0 +1,406 @@
+# traffic_import.py
+
+import argparse
+import bz2
+import csv
+import gzip
+import json
+import logging
+import lzma
+import sqlite3
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+from db_utils import get_connection, init_db
+from traffic_api import compute_jam_factors
+from spatial_index import resolve_point_ids, reset_point_cache
+from logger_config import setup_logging
+
+"""
+Masowy import zarchiwizowanych odpowiedzi TomTom Flow Segment Data.
+
+Obsługiwane formaty (opcjonalnie skompresowane: .gz, .bz2, .xz):
+- JSON Lines (.jsonl / .ndjson): jeden obiekt na linię z polami 'timestamp',
+  'lat'/'lon' (lub 'point' = "lat,lon") oraz 'flowSegmentData'. Przy braku
+  współrzędnych używany jest pierwszy punkt z flowSegmentData.coordinates.
+- CSV: nagłówek z kolumnami timestamp, lat, lon, currentSpeed,
+  freeFlowSpeed, confidence.
+
+Plik czytany jest strumieniowo w paczkach; jam_factor liczony jest wsadowo
+tą samą formułą co w traffic_api, a każda paczka zapisywana jest w jednej
+transakcji razem z punktem kontrolnym (offset bajtowy), dzięki czemu
+przerwany import można wznowić. Indeks czasu tabeli 'traffic' jest usuwany
+przed zapisem pierwszej paczki i odbudowywany raz na końcu; przebieg bez
+nowych danych pozostawia indeks nienaruszony.
+"""
+
+DEFAULT_CHUNK_SIZE = 100_000
+DEFAULT_PROVIDER = "tomtom_flow_archive"
+
+COMPRESSED_OPENERS = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+JSON_SUFFIXES = {".jsonl", ".ndjson", ".json"}
+
+# Deferred index: odbudowywany po zakończeniu importu
+TRAFFIC_TIME_INDEX_DDL = "CREATE INDEX IF NOT EXISTS idx_traffic_time ON traffic(timestamp);"
+
+INSERT_QUERY = """
+    INSERT INTO traffic (
+        timestamp, lat, lon, speed, speed_limit,
+        jam_factor, confidence, provider, point_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Surowy rekord: (timestamp, lat, lon, speed, free_flow_speed, confidence)
+RawRecord = Tuple[str, float, float, Optional[float], Optional[float], Optional[float]]
+
+
+def open_dump(path: Path) -> BinaryIO:
+    """Otwiera plik zrzutu w trybie binarnym, z dekompresją wg rozszerzenia."""
+    opener = COMPRESSED_OPENERS.get(path.suffix.lower())
+    if opener:
+        return opener(path, "rb")
+    return open(path, "rb")
+
+
+def detect_format(path: Path) -> str:
+    """Zwraca 'json' lub 'csv' na podstawie rozszerzenia (z pominięciem kompresji)."""
+    suffixes = [s.lower() for s in path.suffixes]
+    if suffixes and suffixes[-1] in COMPRESSED_OPENERS:
+        suffixes = suffixes[:-1]
+    if suffixes and suffixes[-1] in JSON_SUFFIXES:
+        return "json"
+    if suffixes and suffixes[-1] == ".csv":
+        return "csv"
+    raise ValueError(f"Nieobsługiwany format pliku: {path.name}")
+
+
+def _optional_float(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def normalize_timestamp(value) -> str:
+    """
+    Sprowadza znacznik czasu ISO 8601 do formatu zapisywanego przez fetch_point_traffic.
+
+    Wynik to UTC z dokładnością do sekund ('2024-05-02T10:00:00+00:00'); sufiks 'Z'
+    jest akceptowany, a znaczniki bez strefy traktowane są jako UTC. Wartości
+    nie-tekstowe (np. liczby epoki) i niepoprawne napisy powodują ValueError.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"Znacznik czasu nie jest tekstem ISO 8601: {value!r}")
+    text = value.strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def parse_json_line(line: bytes) -> Optional[RawRecord]:
+    """Parsuje linię JSONL do surowego rekordu; None dla linii niepełnych."""
+    obj = json.loads(line)
+    flow = obj.get("flowSegmentData") or {}
+    timestamp = obj.get("timestamp")
+    if not timestamp:
+        return None
+
+    lat, lon = obj.get("lat"), obj.get("lon")
+    if (lat is None or lon is None) and obj.get("point"):
+        lat, lon = obj["point"].split(",")
+    if lat is None or lon is None:
+        coords = (flow.get("coordinates") or {}).get("coordinate") or []
+        if not coords:
+            return None
+        lat, lon = coords[0].get("latitude"), coords[0].get("longitude")
+
+    return (
+        normalize_timestamp(timestamp), float(lat), float(lon),
+        _optional_float(flow.get("currentSpeed")),
+        _optional_float(flow.get("freeFlowSpeed")),
+        _optional_float(flow.get("confidence", 0.0)),
+    )
+
+
+def make_csv_parser(header: bytes) -> Callable[[bytes], Optional[RawRecord]]:
+    """Tworzy parser wierszy CSV na podstawie nagłówka pliku."""
+    columns = next(csv.reader([header.decode("utf-8-sig")]))
+    index = {name.strip(): i for i, name in enumerate(columns)}
+    required = ("timestamp", "lat", "lon", "currentSpeed", "freeFlowSpeed")
+    missing = [c for c in required if c not in index]
+    if missing:
+        raise ValueError(f"Brak wymaganych kolumn CSV: {', '.join(missing)}")
+
+    conf_idx = index.get("confidence")
+
+    def parse(line: bytes) -> Optional[RawRecord]:
+        row = next(csv.reader([line.decode("utf-8")]))
+        if not row or not row[index["timestamp"]]:
+            return None
+        return (
+            normalize_timestamp(row[index["timestamp"]]),
+            float(row[index["lat"]]), float(row[index["lon"]]),
+            _optional_float(row[index["currentSpeed"]]),
+            _optional_float(row[index["freeFlowSpeed"]]),
+            _optional_float(row[conf_idx]) if conf_idx is not None else 0.0,
+        )
+
+    return parse
+
+
+def iter_chunks(f: BinaryIO, parse: Callable[[bytes], Optional[RawRecord]], offset: int,
+                chunk_size: int) -> Iterator[Tuple[List[RawRecord], int, int]]:
+    """
+    Czyta plik linia po linii od podanego offsetu i zwraca paczki rekordów.
+
+    Każda paczka to (rekordy, offset_po_paczce, liczba_odrzuconych_linii).
+    Offset liczony jest w bajtach strumienia po dekompresji.
+    """
+    chunk: List[RawRecord] = []
+    rejected = 0
+    for line in f:
+        offset += len(line)
+        if not line.strip():
+            continue
+        try:
+            record = parse(line)
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+            record = None
+        if record is None:
+            rejected += 1
+            continue
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk, offset, rejected
+            chunk, rejected = [], 0
+    if chunk or rejected:
+        yield chunk, offset, rejected
+
+
+def init_checkpoints(conn: sqlite3.Connection) -> None:
+    """Tworzy tabelę punktów kontrolnych importu."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS import_checkpoints (
+            source TEXT PRIMARY KEY,
+            byte_offset INTEGER NOT NULL,
+            rows_imported INTEGER NOT NULL DEFAULT 0,
+            rows_rejected INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            skipped_bytes INTEGER NOT NULL DEFAULT 0,  -- Początek pliku pominięty przez --offset
+            updated_at TEXT
+        );
+    """)
+
+    # Migracja tabel sprzed wprowadzenia kolumny skipped_bytes
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(import_checkpoints)")]
+    if "skipped_bytes" not in columns:
+        conn.execute("ALTER TABLE import_checkpoints ADD COLUMN skipped_bytes INTEGER NOT NULL DEFAULT 0;")
+    conn.commit()
+
+
+def _load_checkpoint(conn: sqlite3.Connection, source: str) -> Tuple[int, int, int, bool, int]:
+    row = conn.execute(
+        "SELECT byte_offset, rows_imported, rows_rejected, completed, skipped_bytes "
+        "FROM import_checkpoints WHERE source = ?",
+        (source,),
+    ).fetchone()
+    if row is None:
+        return 0, 0, 0, False, 0
+    return row[0], row[1], row[2], bool(row[3]), row[4]
+
+
+def _save_checkpoint(cur: sqlite3.Cursor, source: str, offset: int, imported: int,
+                     rejected: int, completed: bool, skipped: int) -> None:
+    cur.execute("""
+        INSERT INTO import_checkpoints (
+            source, byte_offset, rows_imported, rows_rejected, completed, skipped_bytes, updated_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (source) DO UPDATE SET
+            byte_offset = excluded.byte_offset,
+            rows_imported = excluded.rows_imported,
+            rows_rejected = excluded.rows_rejected,
+            completed = excluded.completed,
+            skipped_bytes = excluded.skipped_bytes,
+            updated_at = excluded.updated_at
+    """, (source, offset, imported, rejected, int(completed), skipped,
+          datetime.now(timezone.utc).isoformat(timespec="seconds")))
+
+
+def import_dump(conn: sqlite3.Connection, path: Path, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                provider: str = DEFAULT_PROVIDER, restart: bool = False,
+                start_offset: Optional[int] = None, allow_duplicates: bool = False,
+                before_write: Optional[Callable[[], None]] = None) -> Tuple[int, int]:
+    """
+    Importuje jeden plik zrzutu do tabeli 'traffic'.
+
+    Wznawia pracę od zapisanego punktu kontrolnego (chyba że restart=True
+    lub podano start_offset). Tabela 'traffic' nie ma klucza unikalności,
+    więc restart pliku z już zaimportowanymi rekordami wymaga
+    allow_duplicates=True. Plik importowany od ręcznie podanego offsetu
+    nigdy nie jest oznaczany jako zakończony: liczba pominiętych bajtów
+    zapisywana jest w punkcie kontrolnym i raportowana przy każdym przebiegu.
+    before_write wywoływane jest raz, przed zapisem pierwszej paczki.
+    Zwraca (zaimportowane, odrzucone) w tym przebiegu.
+    """
+    source = str(path.resolve())
+    offset, imported, rejected, completed, skipped = _load_checkpoint(conn, source)
+    if restart:
+        if imported and not allow_duplicates:
+            logging.error(
+                "Odmowa restartu %s: zaimportowano już %d rekordów, ponowny import je zduplikuje "
+                "(użyj --allow-duplicates, aby wymusić).", path.name, imported,
+            )
+            return 0, 0
+        if imported:
+            logging.warning("Restart %s: %d wcześniej zaimportowanych rekordów zostanie zduplikowanych.",
+                            path.name, imported)
+        offset, imported, rejected, completed, skipped = 0, 0, 0, False, 0
+    if start_offset is not None:
+        logging.warning("%s: pominięto pierwsze %d bajtów (--offset); rekordy z tego zakresu "
+                        "nie zostaną zaimportowane.", path.name, start_offset)
+        offset, completed, skipped = start_offset, False, start_offset
+    if completed:
+        logging.info("Pominięto %s: import zakończony wcześniej (%d rekordów).", path.name, imported)
+        return 0, 0
+
+    run_imported = run_rejected = 0
+    with open_dump(path) as f:
+        if detect_format(path) == "json":
+            parse = parse_json_line
+        else:
+            header = f.readline()
+            parse = make_csv_parser(header)
+            offset = max(offset, len(header))
+
+        if offset:
+            f.seek(offset)
+            logging.info("Wznawianie importu %s od bajtu %d.", path.name, offset)
+
+        cur = conn.cursor()
+        for chunk, offset, chunk_rejected in iter_chunks(f, parse, offset, chunk_size):
+            if before_write is not None:
+                before_write()
+                before_write = None
+
+            # --- Feature Engineering: Jam Factor dla całej paczki naraz ---
+            jam_factors = compute_jam_factors([r[3] for r in chunk], [r[4] for r in chunk])
+            point_ids = resolve_point_ids(conn, [(r[1], r[2]) for r in chunk])
+
+            cur.executemany(INSERT_QUERY, (
+                (r[0], r[1], r[2], r[3], r[4], jam, r[5], provider, point_id)
+                for r, jam, point_id in zip(chunk, jam_factors, point_ids)
+            ))
+            imported += len(chunk)
+            rejected += chunk_rejected
+            run_imported += len(chunk)
+            run_rejected += chunk_rejected
+
+            # Rekordy i punkt kontrolny w tej samej transakcji (spójne wznowienie)
+            _save_checkpoint(cur, source, offset, imported, rejected, completed=False, skipped=skipped)
+            conn.commit()
+            logging.info("%s: zaimportowano %d rekordów (offset %d).", path.name, imported, offset)
+
+        _save_checkpoint(cur, source, offset, imported, rejected, completed=not skipped, skipped=skipped)
+        conn.commit()
+
+    if skipped:
+        logging.warning("%s: przeczytano do końca, ale pierwsze %d bajtów nigdy nie zaimportowano (--offset); "
+                        "plik nie jest oznaczony jako zakończony.", path.name, skipped)
+
+    return run_imported, run_rejected
+
+
+def bulk_import(paths: List[Path], chunk_size: int = DEFAULT_CHUNK_SIZE,
+                provider: str = DEFAULT_PROVIDER, restart: bool = False,
+                start_offset: Optional[int] = None, allow_duplicates: bool = False) -> int:
+    """
+    Importuje listę plików w trybie masowym i zwraca łączną liczbę rekordów.
+
+    Indeks idx_traffic_time usuwany jest dopiero przed zapisem pierwszej
+    paczki, a połączenie pracuje z powiększonym cache stron; indeks
+    odbudowywany jest raz na końcu (również po błędzie lub przerwaniu).
+    Gdy nie ma nic do zaimportowania, indeks pozostaje nienaruszony.
+    start_offset dopuszczalny jest tylko dla pojedynczego pliku.
+    """
+    if start_offset is not None and len(paths) > 1:
+        raise ValueError("start_offset można podać tylko dla jednego pliku")
+
+    init_db()
+    conn = get_connection()
+    total = 0
+    started = time.perf_counter()
+    index_dropped = False
+
+    def drop_time_index() -> None:
+        # Deferred index: usuwany tylko, gdy faktycznie zapisujemy dane
+        nonlocal index_dropped
+        if not index_dropped:
+            conn.execute("DROP INDEX IF EXISTS idx_traffic_time")
+            conn.commit()
+            index_dropped = True
+
+    try:
+        init_checkpoints(conn)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA cache_size = -200000")  # ~200 MB cache stron
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+        for path in paths:
+            try:
+                imported, rejected = import_dump(conn, path, chunk_size, provider, restart, start_offset,
+                                                 allow_duplicates, before_write=drop_time_index)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                logging.error("Błąd importu pliku %s: %s", path, e)
+                conn.rollback()
+                reset_point_cache()
+                continue
+            total += imported
+            logging.info("✅ %s: %d rekordów, odrzucono %d linii.", path.name, imported, rejected)
+    finally:
+        # Przerwana paczka (np. Ctrl+C) nie może zostać zatwierdzona bez punktu kontrolnego
+        conn.rollback()
+        reset_point_cache()
+        if index_dropped:
+            logging.info("Odbudowa indeksu idx_traffic_time...")
+            conn.execute(TRAFFIC_TIME_INDEX_DDL)
+            conn.execute("ANALYZE traffic")
+            conn.commit()
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    logging.info("Import zakończony: %d rekordów w %.1f s (%.0f rek/s).",
+                 total, elapsed, total / elapsed if elapsed else 0.0)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Masowy import archiwalnych danych TomTom Flow.")
+    parser.add_argument("files", nargs="+", type=Path, help="Pliki .jsonl/.csv (opcjonalnie .gz/.bz2/.xz)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rekordów na transakcję")
+    parser.add_argument("--provider", default=DEFAULT_PROVIDER, help="Wartość kolumny 'provider'")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignoruj zapisane punkty kontrolne i importuj pliki od początku. Tabela 'traffic' "
+                             "nie ma klucza unikalności: pliki z już zaimportowanymi rekordami są pomijane, "
+                             "chyba że podano --allow-duplicates")
+    parser.add_argument("--allow-duplicates", action="store_true",
+                        help="Pozwól --restart ponownie zaimportować rekordy (zostaną zduplikowane)")
+    parser.add_argument("--offset", type=int, default=None,
+                        help="Rozpocznij od podanego offsetu bajtowego (tylko dla jednego pliku; "
+                             "pominięte bajty nie zostaną zaimportowane)")
+    args = parser.parse_args()
+    if args.offset is not None and len(args.files) > 1:
+        parser.error("--offset można podać tylko dla jednego pliku")
+
+    setup_logging()
+    count = bulk_import(args.files, args.chunk_size, args.provider, args.restart, args.offset,
+                        args.allow_duplicates)
+    print(f"✅ Zaimportowano {count} rekordów ruchu.")
@@ -0,0 +1,233 @@
+# weather_coverage.py
+
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from db_utils import get_connection
+from config import (
+    WEATHER_SITES, WEATHER_SITE_KEY, WEATHER_SITE_CITIES, WEATHER_MIN_ROWS_PER_DAY,
+    WEATHER_RETRY_BASE_MINUTES, WEATHER_RETRY_MAX_MINUTES, WEATHER_MAX_ATTEMPTS,
+)
+
+"""
+Rejestr pokrycia danych historycznych pogody (Coverage Tracking).
+
+Dla każdej pary (miasto, dzień) przechowuje status ostatniego pobrania,
+liczbę zapisanych rekordów oraz termin kolejnej próby (exponential backoff).
+Pełna historia prób trafia do tabeli 'weather_fetch_attempts'. Wykrywanie
+luk to jedno zapytanie SQL, więc ponowny scraping dotyczy wyłącznie
+brakujących lub niekompletnych dni.
+"""
+
+# Statusy pobrania dnia
+STATUS_OK = "ok"
+STATUS_ROBOTS_BLOCKED = "robots_blocked"
+STATUS_FETCH_FAILED = "fetch_failed"
+STATUS_PARSE_EMPTY = "parse_empty"
+STATUS_ERROR = "error"
+
+DEFAULT_CITY_KEY = WEATHER_SITE_CITIES[WEATHER_SITE_KEY]
+
+# Współrzędne, pod którymi scraper zapisuje rekordy danego miasta (z config.WEATHER_SITES)
+CITY_COORDS: Dict[str, Tuple[float, float]] = {
+    city: WEATHER_SITES[site] for site, city in WEATHER_SITE_CITIES.items()
+}
+
+
+def _city_coords(city: str) -> Tuple[float, float]:
+    """Zwraca (lat, lon) rekordów pogodowych miasta z rejestru."""
+    try:
+        return CITY_COORDS[city]
+    except KeyError:
+        raise ValueError(f"Nieznane miasto w rejestrze pokrycia: {city}") from None
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(timespec="seconds")
+
+
+def init_coverage() -> None:
+    """Tworzy tabele rejestru pokrycia i historii prób, jeśli nie istnieją."""
+    conn = get_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS weather_coverage (
+            city TEXT NOT NULL,
+            day TEXT NOT NULL,              -- Format: YYYY-MM-DD
+            status TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_attempt TEXT,
+            next_attempt_after TEXT,        -- Najwcześniejszy termin ponownej próby (backoff)
+            last_error TEXT,
+            PRIMARY KEY (city, day)
+        );
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS weather_fetch_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city TEXT NOT NULL,
+            day TEXT NOT NULL,
+            attempted_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fetch_attempts_day ON weather_fetch_attempts(city, day);")
+
+    conn.commit()
+    conn.close()
+
+
+def backoff_minutes(attempts: int) -> float:
+    """Opóźnienie kolejnej próby: podwajane po każdej porażce, z górnym limitem."""
+    return min(WEATHER_RETRY_BASE_MINUTES * (2 ** max(attempts - 1, 0)), WEATHER_RETRY_MAX_MINUTES)
+
+
+def count_day_rows(conn: sqlite3.Connection, d: date, city: str = DEFAULT_CITY_KEY) -> int:
+    """Liczba rekordów pogodowych miasta zapisanych dla danego dnia (indeks idx_weather_site_time)."""
+    lat, lon = _city_coords(city)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT COUNT(*) FROM weather WHERE lat = ? AND lon = ? AND timestamp >= ? AND timestamp < ?",
+        (lat, lon, d.isoformat(), (d + timedelta(days=1)).isoformat()),
+    )
+    return cur.fetchone()[0]
+
+
+def record_attempt(d: date, status: str, error: Optional[str] = None,
+                   city: str = DEFAULT_CITY_KEY) -> None:
+    """
+    Zapisuje wynik próby pobrania dnia w historii i aktualizuje rejestr pokrycia.
+
+    Dzień uznawany jest za kompletny, gdy status to 'ok' i liczba rekordów
+    osiąga WEATHER_MIN_ROWS_PER_DAY. W przeciwnym razie wyznaczany jest
+    termin kolejnej próby zgodnie z polityką backoff.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        now = _utc_now()
+        day = d.isoformat()
+        row_count = count_day_rows(conn, d, city)
+
+        cur.execute("SELECT attempts FROM weather_coverage WHERE city = ? AND day = ?", (city, day))
+        row = cur.fetchone()
+        attempts = (row[0] if row else 0) + 1
+
+        complete = status == STATUS_OK and row_count >= WEATHER_MIN_ROWS_PER_DAY
+        next_after = None if complete else _iso(now + timedelta(minutes=backoff_minutes(attempts)))
+
+        cur.execute("""
+            INSERT INTO weather_fetch_attempts (city, day, attempted_at, status, row_count, error)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (city, day, _iso(now), status, row_count, error))
+
+        cur.execute("""
+            INSERT INTO weather_coverage (
+                city, day, status, row_count, attempts, last_attempt, next_attempt_after, last_error
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (city, day) DO UPDATE SET
+                status = excluded.status,
+                row_count = excluded.row_count,
+                attempts = excluded.attempts,
+                last_attempt = excluded.last_attempt,
+                next_attempt_after = excluded.next_attempt_after,
+                last_error = excluded.last_error
+        """, (city, day, status, row_count, attempts, _iso(now), next_after, error))
+
+        conn.commit()
+    except sqlite3.Error as e:
+        logging.error("Błąd zapisu rejestru pokrycia dla %s: %s", d, e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def sync_row_counts(year: int, city: str = DEFAULT_CITY_KEY) -> None:
+    """
+    Uzupełnia rejestr o liczby rekordów miasta z tabeli 'weather' (jedno zapytanie GROUP BY).
+
+    Pozwala objąć rejestrem dane pobrane przed jego wprowadzeniem: dni z
+    rekordami, których nie ma jeszcze w rejestrze, otrzymują status 'ok'.
+    """
+    lat, lon = _city_coords(city)
+    conn = get_connection()
+    try:
+        conn.execute("""
+            INSERT INTO weather_coverage (city, day, status, row_count)
+            SELECT ?, substr(timestamp, 1, 10) AS day, ?, COUNT(*)
+            FROM weather
+            WHERE lat = ? AND lon = ? AND timestamp >= ? AND timestamp < ?
+            GROUP BY day
+            ON CONFLICT (city, day) DO UPDATE SET row_count = excluded.row_count
+        """, (city, STATUS_OK, lat, lon, f"{year}-01-01", f"{year + 1}-01-01"))
+        conn.commit()
+    except sqlite3.Error as e:
+        logging.error("Błąd synchronizacji liczby rekordów dla roku %d: %s", year, e)
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def find_gaps(year: int, respect_backoff: bool = True, include_exhausted: bool = False,
+              city: str = DEFAULT_CITY_KEY) -> List[date]:
+    """
+    Zwraca dni roku, które są brakujące lub niekompletne (jedno zapytanie SQL).
+
+    Kalendarz roku generowany jest rekurencyjnym CTE i łączony z rejestrem.
+    Przy respect_backoff=True pomijane są dni, których termin ponownej próby
+    jeszcze nie nadszedł. Dni, które wyczerpały WEATHER_MAX_ATTEMPTS prób,
+    pomijane są, chyba że include_exhausted=True.
+    """
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            WITH RECURSIVE calendar(day) AS (
+                SELECT date(?)
+                UNION ALL
+                SELECT date(day, '+1 day') FROM calendar WHERE day < date(?)
+            )
+            SELECT c.day
+            FROM calendar c
+            LEFT JOIN weather_coverage wc ON wc.city = ? AND wc.day = c.day
+            WHERE (wc.day IS NULL OR wc.status != ? OR wc.row_count < ?)
+              AND (? = 0 OR wc.next_attempt_after IS NULL OR wc.next_attempt_after <= ?)
+              AND (? = 1 OR wc.attempts IS NULL OR wc.attempts < ?)
+            ORDER BY c.day
+        """, (
+            f"{year}-01-01", f"{year}-12-31", city,
+            STATUS_OK, WEATHER_MIN_ROWS_PER_DAY,
+            int(respect_backoff), _iso(_utc_now()),
+            int(include_exhausted), WEATHER_MAX_ATTEMPTS,
+        ))
+        return [date.fromisoformat(r[0]) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def coverage_summary(year: int, city: str = DEFAULT_CITY_KEY) -> List[tuple]:
+    """Liczba dni i rekordów w rejestrze w podziale na status (do raportu w konsoli)."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT status, COUNT(*), SUM(row_count)
+            FROM weather_coverage
+            WHERE city = ? AND day BETWEEN ? AND ?
+            GROUP BY status
+            ORDER BY status
+        """, (city, f"{year}-01-01", f"{year}-12-31"))
+        return cur.fetchall()
+    finally:
+        conn.close()
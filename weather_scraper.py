@@ -5,13 +5,22 @@ import random
 import requests
 from bs4 import BeautifulSoup
 from datetime import datetime, date
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 
 from db_utils import get_connection
-from config import CITY_NAME, COUNTRY_SLUG, LAT_OP, LON_OP
+from config import (
+    CITY_NAME, COUNTRY_SLUG, WEATHER_SITES, WEATHER_SITE_KEY, WEATHER_BASE_URL, WEATHER_PROXIES,
+)
 from robots_checker import is_scraping_allowed
+from weather_coverage import (
+    record_attempt, STATUS_OK, STATUS_ROBOTS_BLOCKED, STATUS_FETCH_FAILED,
+    STATUS_PARSE_EMPTY, STATUS_ERROR,
+)
 
-BASE_URL = "https://www.timeanddate.com/weather"
+BASE_URL = WEATHER_BASE_URL
+
+# Współrzędne zapisywanych obserwacji (te same, po których liczy rejestr pokrycia)
+SITE_LAT, SITE_LON = WEATHER_SITES[WEATHER_SITE_KEY]
 
 # User-Agent identyfikujący naszego bota (dobra praktyka etyczna)
 HEADERS = {
@@ -19,11 +28,8 @@ HEADERS = {
 }
 
 # Lista serwerów proxy do rotacji IP (zapobieganie blokadom).
-# W środowisku produkcyjnym ta lista powinna pochodzić z płatnego API lub zmiennych środowiskowych.
-PROXY_LIST = [
-    "http://20.210.113.32:8123",
-    "http://186.121.235.66:8080",
-]
+# Pochodzi ze zmiennej środowiskowej WEATHER_PROXIES (patrz config.py).
+PROXY_LIST = WEATHER_PROXIES
 
 def get_random_proxy() -> Dict[str, str]:
     """Losuje serwer proxy z puli dostępnych adresów."""
@@ -41,7 +47,7 @@ def build_day_url(d: date) -> str:
     )
 
 
-def fetch_day_html(d: date) -> Optional[str]:
+def fetch_day_html(d: date) -> Tuple[Optional[str], str, Optional[str]]:
     """
     Pobiera kod HTML strony z danymi historycznymi.
     
@@ -49,13 +55,15 @@ def fetch_day_html(d: date) -> Optional[str]:
     1. Sprawdza robots.txt.
     2. Próbuje połączenia przez losowe Proxy.
     3. W razie błędu (Fallback), próbuje połączenia bezpośredniego.
+
+    Zwraca krotkę (html, status, błąd) na potrzeby rejestru pokrycia.
     """
     url = build_day_url(d)
     
     # Krok 1: Weryfikacja etyczna (Robots Exclusion Protocol)
     if not is_scraping_allowed(url, HEADERS["User-Agent"]):
-        logging.warning(f"⛔ Scraping zablokowany przez robots.txt dla: {url}")
-        return None
+        logging.warning("⛔ Scraping zablokowany przez robots.txt dla: %s", url)
+        return None, STATUS_ROBOTS_BLOCKED, "robots.txt"
 
     # Krok 2: Próba połączenia przez Proxy (anonimizacja)
     try:
@@ -63,18 +71,18 @@ def fetch_day_html(d: date) -> Optional[str]:
         # Timeout 5s dla proxy (szybka weryfikacja czy działa)
         resp = requests.get(url, headers=HEADERS, proxies=proxy, timeout=5)
         resp.raise_for_status()
-        return resp.text
+        return resp.text, STATUS_OK, None
     except Exception:
         # Krok 3: Fallback - połączenie bezpośrednie (Direct Connection)
         # Używane, gdy proxy zawiedzie. Dłuższy timeout (20s).
         try:
-            logging.info(f"Proxy failed for {url}. Switching to direct connection...")
+            logging.info("Proxy failed for %s. Switching to direct connection...", url)
             resp = requests.get(url, headers=HEADERS, timeout=20)
             resp.raise_for_status()
-            return resp.text
+            return resp.text, STATUS_OK, None
         except Exception as e2:
-            logging.error(f"❌ Krytyczny błąd pobierania {url}: {e2}")
-            return None
+            logging.error("❌ Krytyczny błąd pobierania %s: %s", url, e2)
+            return None, STATUS_FETCH_FAILED, str(e2)
 
 
 def parse_float(text: str) -> Optional[float]:
@@ -157,8 +165,8 @@ def parse_weather_table(html: str, d: date) -> List[Dict[str, Any]]:
 
             record = {
                 "timestamp": timestamp_iso,
-                "lat": LAT_OP,
-                "lon": LON_OP,
+                "lat": SITE_LAT,
+                "lon": SITE_LON,
                 "temperature_c": parse_float(temp_txt),
                 "weather_desc": weather_desc,
                 "wind_speed": parse_float(wind_txt),
@@ -170,7 +178,7 @@ def parse_weather_table(html: str, d: date) -> List[Dict[str, Any]]:
             }
             records.append(record)
         except Exception as e:
-            logging.warning(f"Błąd parsowania wiersza: {e}")
+            logging.warning("Błąd parsowania wiersza: %s", e)
             continue
 
     return records
@@ -179,7 +187,8 @@ def parse_weather_table(html: str, d: date) -> List[Dict[str, Any]]:
 def save_weather_records(records: List[Dict[str, Any]]) -> None:
     """
     Idempotentny zapis rekordów pogodowych do bazy danych.
-    Sprawdza istnienie rekordu przed wstawieniem (unikaty po timestamp).
+    Duplikaty (ten sam timestamp i lokalizacja) odrzuca unikalny indeks
+    idx_weather_unique, więc cała paczka trafia do bazy jednym executemany.
     """
     if not records:
         return
@@ -188,48 +197,58 @@ def save_weather_records(records: List[Dict[str, Any]]) -> None:
     try:
         cur = conn.cursor()
 
-        for r in records:
-            # Sprawdzenie duplikatów
-            cur.execute("SELECT 1 FROM weather WHERE timestamp = ? LIMIT 1", (r["timestamp"],))
-            if cur.fetchone():
-                continue
-
-            cur.execute("""
-                INSERT INTO weather (
-                    timestamp, lat, lon, temperature_c, weather_desc, 
-                    wind_speed, humidity, pressure, visibility, source
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                r["timestamp"], r["lat"], r["lon"], r["temperature_c"], r["weather_desc"],
-                r["wind_speed"], r["humidity"], r["pressure"], r["visibility"], r["source"]
-            ))
+        cur.executemany("""
+            INSERT OR IGNORE INTO weather (
+                timestamp, lat, lon, temperature_c, weather_desc, 
+                wind_speed, humidity, pressure, visibility, source
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(
+            r["timestamp"], r["lat"], r["lon"], r["temperature_c"], r["weather_desc"],
+            r["wind_speed"], r["humidity"], r["pressure"], r["visibility"], r["source"]
+        ) for r in records])
 
         conn.commit()
     except Exception as e:
-        logging.error(f"Błąd zapisu danych pogodowych: {e}")
+        logging.error("Błąd zapisu danych pogodowych: %s", e)
     finally:
         conn.close()
 
 
-def scrape_day(d: date) -> None:
+def scrape_day(d: date) -> str:
     """
     Główna funkcja procesu ETL dla danych pogodowych (Extract -> Transform -> Load).
+
+    Wynik każdej próby (status, liczba rekordów dnia) zapisywany jest
+    w rejestrze pokrycia (weather_coverage). Zwraca status pobrania.
     """
-    html = fetch_day_html(d)
-    if html:
-        records = parse_weather_table(html, d)
-        save_weather_records(records)
-        logging.info(f"📅 {d}: Pomyślnie przetworzono {len(records)} rekordów pogodowych.")
-    else:
-        logging.warning(f"📅 {d}: Brak danych HTML do przetworzenia.")
+    try:
+        html, status, error = fetch_day_html(d)
+        if html:
+            records = parse_weather_table(html, d)
+            save_weather_records(records)
+            if records:
+                logging.info("📅 %s: Pomyślnie przetworzono %d rekordów pogodowych.", d, len(records))
+            else:
+                status, error = STATUS_PARSE_EMPTY, "Brak wierszy w tabeli pogodowej"
+                logging.warning("📅 %s: Strona pobrana, ale tabela pogodowa jest pusta.", d)
+        else:
+            logging.warning("📅 %s: Brak danych HTML do przetworzenia.", d)
+    except Exception as e:
+        status, error = STATUS_ERROR, str(e)
+        logging.error("📅 %s: Błąd przetwarzania dnia: %s", d, e)
+
+    record_attempt(d, status, error)
+    return status
 
 
 if __name__ == "__main__":
     # Test manualny modułu
     from db_utils import init_db  
+    from weather_coverage import init_coverage
     
     logging.basicConfig(level=logging.INFO)
     init_db() 
+    init_coverage()
     
     # Test dla konkretnej daty
     test_d = date(2024, 5, 2)